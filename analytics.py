@@ -0,0 +1,81 @@
+
+# Umami event tracking through the shared HTTP pool (http_client.py).
+# On the bot's event loop, track() sends in the background so a slow Umami
+# never holds up a handler; from threads (the dashboard) it sends inline.
+# Events are the first thing dropped under load (see backpressure.py).
+
+from datetime import datetime, timezone
+import logging
+import asyncio
+
+from config import UMAMI_URL, UMAMI_TOKEN, UMAMI_SITE_ID
+from backpressure import backpressure, TELEMETRY
+from http_client import http
+
+log = logging.getLogger("analytics")
+pending = set()
+
+
+def umami_headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {UMAMI_TOKEN}",
+        "User-Agent": "berubot"
+    }
+
+
+def umami_payload(event_name, data):
+    return {
+        "type": "event",
+        "payload": {
+            "hostname": "berubot.onrender.com",
+            "language": "en-US",
+            "referrer": "",
+            "screen": "unknown",
+            "title": event_name,
+            "url": "/",
+            "website": UMAMI_SITE_ID,
+            "name": event_name,
+            "data": {
+                **data,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        }
+    }
+
+
+def track_umami_event(event_name, data):
+    if not UMAMI_URL or backpressure.shedding(TELEMETRY):
+        return
+    try:
+        # Event posts are safe to retry: Umami would only count a duplicate.
+        res = http.request("POST", UMAMI_URL, retry=True, json=umami_payload(event_name, data), headers=umami_headers())
+        log.info("📈 Umami event sent", extra={"event": event_name, "status": res.status_code})
+    except Exception as e:
+        log.warning(f"📈 Umami event {event_name} failed: {e}")
+
+
+async def track_umami_event_async(event_name, data):
+    if not UMAMI_URL or backpressure.shedding(TELEMETRY):
+        return
+    try:
+        res = await http.arequest("POST", UMAMI_URL, retry=True, json=umami_payload(event_name, data), headers=umami_headers())
+        log.info("📈 Umami event sent", extra={"event": event_name, "status": res.status_code})
+    except Exception as e:
+        log.warning(f"📈 Umami event {event_name} failed: {e}")
+
+
+def track(event_name, data):
+    """Sends an event without waiting for it when called on the event loop."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return track_umami_event(event_name, data)
+    task = loop.create_task(track_umami_event_async(event_name, data))
+    pending.add(task)
+    task.add_done_callback(pending.discard)
+
+
+async def drain():
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
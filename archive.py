@@ -0,0 +1,139 @@
+
+# Cold tier for closed requests.
+#
+# Cancelled requests go straight to the archive; completed ones stay in the hot
+# queue for ARCHIVE_GRACE_HOURS (so "Check Status" still reports them) and are
+# then moved by sweep(). The archive is an append-only compact NDJSON file.
+# History statistics are built from it on first use and then kept up to date
+# incrementally, so the full archive is never held in memory.
+
+from dataclasses import replace
+from datetime import datetime, timedelta
+from array import array
+import threading
+import logging
+import json
+import os
+
+from store import request_queue, queue_lock, save_queue
+from tenants import current
+from records import Record, Status
+import records
+
+ARCHIVE_FILE = "archive.ndjson"
+ARCHIVE_GRACE = timedelta(hours=float(os.environ.get("ARCHIVE_GRACE_HOURS", 24)))
+
+archive_lock = threading.Lock()
+
+
+def archive_file():
+    return current().path(ARCHIVE_FILE)
+
+
+def turnaround_seconds(record):
+    if record.timestamp is None or record.closed_at is None:
+        return None
+    return record.closed_at - record.timestamp
+
+
+def compact(r, status=None):
+    """The archived form of a queue record: no type, done_at or update_id, plus closed_at."""
+    status = Status(status or r.status)
+    # Entries completed before done_at existed have no known completion time.
+    closed_at = r.done_at if status is Status.DONE else records.now()
+    return replace(r, status=status, type=None, done_at=None, update_id=None, closed_at=closed_at, extra=None)
+
+
+def _count(st, record):
+    status = record.status.value
+    st["total"] += 1
+    st["by_status"][status] = st["by_status"].get(status, 0) + 1
+    user = st["users"].setdefault(record.id, {"name": record.name, "done": 0, "cancelled": 0})
+    user["name"] = record.name or user["name"]
+    user[status] = user.get(status, 0) + 1
+    if record.status is Status.DONE:
+        secs = turnaround_seconds(record)
+        if secs is not None and secs >= 0:
+            st["turnaround"].append(secs)
+
+
+def _stats():
+    # Called with archive_lock held. Built on first use, per tenant.
+    tenant = current()
+    if "archive_stats" not in tenant.components:
+        tenant.components["archive_stats"] = _load_stats()
+    return tenant.components["archive_stats"]
+
+
+def _load_stats():
+    st = {"total": 0, "by_status": {}, "users": {}, "turnaround": array("l")}
+    for record in iter_archive():
+        _count(st, record)
+    return st
+
+
+def iter_archive():
+    if not os.path.exists(archive_file()):
+        return
+    with open(archive_file(), "r") as f:
+        for line in f:
+            try:
+                yield Record.from_json(json.loads(line))
+            except (ValueError, TypeError):
+                continue
+
+
+def append(entries):
+    if not entries:
+        return
+    lines = "".join(json.dumps(r.to_json(), separators=(",", ":"), ensure_ascii=False) + "\n" for r in entries)
+    with archive_lock:
+        with open(archive_file(), "a") as f:
+            f.write(lines)
+        stats = current().components.get("archive_stats")
+        if stats is not None:
+            for r in entries:
+                _count(stats, r)
+
+
+def archive_cancelled(r):
+    append([compact(r, status="cancelled")])
+
+
+def sweep(now=None):
+    """Moves completed requests past the grace period out of the hot queue."""
+    cutoff = ((now or datetime.now()) - ARCHIVE_GRACE).timestamp()
+    with queue_lock:
+        expired = [r for r in request_queue if r.status is Status.DONE and (r.done_at or 0) <= cutoff]
+        if not expired:
+            return 0
+        append([compact(r) for r in expired])
+        moved = {id(r) for r in expired}
+        request_queue[:] = [r for r in request_queue if id(r) not in moved]
+        save_queue()
+    logging.info(f"🗄️ Archived {len(expired)} completed requests.")
+    return len(expired)
+
+
+def history(user_id=None):
+    with archive_lock:
+        stats = _stats()
+        if user_id is not None:
+            user = stats["users"].get(user_id)
+            return {"id": user_id, **user} if user else {"id": user_id, "done": 0, "cancelled": 0}
+        times = sorted(stats["turnaround"])
+        return {
+            "total": stats["total"],
+            "by_status": dict(stats["by_status"]),
+            "users": len(stats["users"]),
+            "top_users": sorted(
+                ({"id": uid, **u} for uid, u in stats["users"].items()),
+                key=lambda u: -u["done"]
+            )[:20],
+            "turnaround_hours": {
+                "count": len(times),
+                "mean": round(sum(times) / len(times) / 3600, 2) if times else None,
+                "median": round(times[len(times) // 2] / 3600, 2) if times else None,
+                "p90": round(times[int(len(times) * 0.9)] / 3600, 2) if times else None,
+            },
+        }
@@ -0,0 +1,125 @@
+
+# Adaptive load shedding.
+#
+# A sampler on the bot's event loop measures loop lag (how late a short sleep
+# wakes up) and the depth of every bot's update queue, and turns them into a
+# level. Each level sheds one more kind of optional work:
+#
+#   1 telemetry   analytics events are dropped
+#   2 welcomes    join welcomes are held back and keep aggregating
+#   3 moderation  admin lists are not refreshed and no warnings are posted
+#
+# Submissions, status checks, cancels and admin actions are never shed. The
+# level rises as soon as a threshold is crossed and steps down one level at a
+# time after SHED_COOLDOWN seconds below it, so it does not flap.
+
+import logging
+import asyncio
+import time
+import os
+
+NORMAL, TELEMETRY, WELCOMES, MODERATION = range(4)
+LEVEL_NAMES = ("normal", "telemetry", "welcomes", "moderation")
+SAMPLE_INTERVAL = 0.25
+SMOOTHING = 0.3  # weight of the newest lag sample
+
+
+def thresholds(spec):
+    """'100,250,500' -> the lower bounds of levels 1..3."""
+    values = [float(v) for v in spec.split(",")]
+    if len(values) != MODERATION or values != sorted(values):
+        raise ValueError(f"expected {MODERATION} increasing thresholds, got {spec!r}")
+    return values
+
+
+LAG_THRESHOLDS = thresholds(os.environ.get("SHED_LAG_MS", "100,250,500"))
+DEPTH_THRESHOLDS = thresholds(os.environ.get("SHED_QUEUE_DEPTH", "20,100,400"))
+COOLDOWN = float(os.environ.get("SHED_COOLDOWN", 10))
+
+
+def level_for(value, bounds):
+    return sum(1 for bound in bounds if value >= bound)
+
+
+class Backpressure:
+    def __init__(self):
+        self.level = NORMAL
+        self.queues = []  # the update queue of every running bot
+        self.lag = 0.0  # smoothed, in seconds
+        self.depth = 0
+        self.below_since = None
+        self.changed_at = time.monotonic()
+        self.seconds_at = [0.0] * len(LEVEL_NAMES)
+        self.changes = 0
+        self.shed = dict.fromkeys(LEVEL_NAMES[1:], 0)
+        self.task = None
+
+    def watch(self, update_queue):
+        self.queues.append(update_queue)
+
+    def shedding(self, level):
+        """True if work of this level should be skipped now (and counts it)."""
+        if self.level < level:
+            return False
+        self.shed[LEVEL_NAMES[level]] += 1
+        return True
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            lag = max(0.0, loop.time() - started - SAMPLE_INTERVAL)
+            self.lag += SMOOTHING * (lag - self.lag)
+            self.depth = sum(q.qsize() for q in self.queues)
+            self.update(max(level_for(self.lag * 1000, LAG_THRESHOLDS),
+                            level_for(self.depth, DEPTH_THRESHOLDS)))
+
+    def update(self, target, now=None):
+        now = now or time.monotonic()
+        if target > self.level:
+            self.below_since = None
+            self._set(target, now)
+        elif target < self.level:
+            if self.below_since is None:
+                self.below_since = now
+            elif now - self.below_since >= COOLDOWN:
+                self.below_since = now
+                self._set(self.level - 1, now)
+        else:
+            self.below_since = None
+
+    def _set(self, level, now):
+        self.seconds_at[self.level] += now - self.changed_at
+        self.changed_at = now
+        self.changes += 1
+        rising = level > self.level
+        self.level = level
+        message = (f"🚦 Load level {LEVEL_NAMES[level]} "
+                   f"(loop lag {self.lag * 1000:.0f}ms, {self.depth} updates waiting).")
+        if rising:
+            logging.warning(message)
+        else:
+            logging.info(message)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def metrics(self):
+        seconds = list(self.seconds_at)
+        seconds[self.level] += time.monotonic() - self.changed_at
+        return {
+            "level": self.level, "name": LEVEL_NAMES[self.level],
+            "loop_lag_ms": round(self.lag * 1000, 1), "queue_depth": self.depth,
+            "changes": self.changes, "shed": dict(self.shed),
+            "seconds_at": {name: round(s, 1) for name, s in zip(LEVEL_NAMES, seconds)},
+        }
+
+
+backpressure = Backpressure()
@@ -0,0 +1,291 @@
+
+# HTTP benchmark for the Flask dashboard routes.
+#
+# Starts dashboard.flask_app in one or more worker processes against a generated queue,
+# answers any getFile lookups from a local stub Bot API and sends
+# concurrent load at every route. Reports requests/sec, latency percentiles and
+# peak memory per worker, and compares against a saved baseline.
+#
+#   python bench_dashboard.py                      # run and compare with baseline
+#   python bench_dashboard.py --save-baseline      # run and store new baseline
+#   python bench_dashboard.py --sizes 50,1000 --duration 3 --concurrency 8
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta
+import subprocess
+import threading
+import argparse
+import tempfile
+import shutil
+import socket
+import json
+import time
+import sys
+import os
+
+BENCH_PASSWORD = "bench"
+BENCH_TOKEN = "123456:bench"
+ROUTES = ["/", "/status", "/adminbeh", "/download-queue"]
+DEFAULT_SIZES = [50, 1000, 10000]
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "dashboard_baseline.json")
+
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """Answers getFile the way api.telegram.org does, without leaving the host."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.endswith("/getFile"):
+            self.send_error(404)
+            return
+        file_id = parse_qs(url.query).get("file_id", [""])[0]
+        body = json.dumps({"ok": True, "result": {
+            "file_id": file_id,
+            "file_unique_id": file_id[-16:],
+            "file_size": 123456,
+            "file_path": f"photos/{file_id}.jpg",
+        }}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_queue(size):
+    start = datetime(2025, 1, 1)
+    return [{
+        "id": 1_000_000 + i,
+        "name": f"user{i}",
+        "status": "done" if i % 5 == 0 else "pending",
+        "type": "photo",
+        "photo_id": f"AgACAgUAAxkBAAI{i:012d}",
+        "caption": f"bench caption {i}",
+        "timestamp": (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+    } for i in range(size)]
+
+
+def serve(port, workdir):
+    # Runs inside a worker subprocess, serving the queue.json generated in workdir.
+    os.environ.setdefault("BOT_TOKEN", BENCH_TOKEN)
+    os.environ.setdefault("ADMIN_ID", "0")
+    os.environ.setdefault("QUEUE_PASSWORD", BENCH_PASSWORD)
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    from werkzeug.serving import make_server
+    from dashboard import flask_app
+    from store import load_queue
+
+    load_queue()
+    make_server("127.0.0.1", port, flask_app, threaded=True).serve_forever()
+
+
+def read_rss_kb(pid):
+    # (current RSS, peak RSS) in KiB from /proc; zeros where /proc is unavailable.
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def load_route(ports, route, concurrency, duration):
+    import requests
+
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(n):
+        nonlocal errors
+        session = requests.Session()
+        base = f"http://127.0.0.1:{ports[n % len(ports)]}"
+        url = f"{base}{route}?password={BENCH_PASSWORD}"
+        # Every client completes at least one request so slow routes still get a sample.
+        while True:
+            t0 = time.perf_counter()
+            try:
+                res = session.get(url, timeout=600)
+                ok = res.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - t0
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+            if time.monotonic() >= deadline:
+                break
+        session.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def bench_size(size, args, stub_url):
+    workdir = tempfile.mkdtemp(prefix=f"berubench-{size}-")
+    procs = []
+    try:
+        with open(os.path.join(workdir, "queue.json"), "w") as f:
+            json.dump(make_queue(size), f)
+
+        env = dict(os.environ, TELEGRAM_API_URL=stub_url, BOT_TOKEN=BENCH_TOKEN,
+                   ADMIN_ID="0", QUEUE_PASSWORD=BENCH_PASSWORD)
+        ports = [free_port() for _ in range(args.workers)]
+        procs = [subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", str(port), workdir],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ) for port in ports]
+
+        for port in ports:
+            if not wait_for_port(port):
+                raise RuntimeError(f"worker on port {port} did not start")
+        idle = [read_rss_kb(p.pid)[0] for p in procs]
+
+        routes = {}
+        for route in ROUTES:
+            routes[route] = load_route(ports, route, args.concurrency, args.duration)
+            r = routes[route]
+            print(f"  {route:<16} {r['rps']:>9.1f} req/s  p50 {r['p50_ms']:>9.2f} ms  "
+                  f"p90 {r['p90_ms']:>9.2f} ms  p99 {r['p99_ms']:>9.2f} ms  "
+                  f"n={r['requests']} err={r['errors']}")
+
+        peak = [read_rss_kb(p.pid)[1] for p in procs]
+        print(f"  memory per worker: idle {idle} KiB, peak {peak} KiB")
+        return {"routes": routes, "memory_kb": {"idle": idle, "peak": peak}}
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for size, data in results.items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for route, r in data["routes"].items():
+            b = base["routes"].get(route)
+            if not b or not b["rps"]:
+                continue
+            if r["rps"] < b["rps"] * (1 - tolerance):
+                regressions.append(f"{size} {route}: {r['rps']} req/s vs baseline {b['rps']}")
+            if b["p99_ms"] and r["p99_ms"] > b["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{size} {route}: p99 {r['p99_ms']} ms vs baseline {b['p99_ms']}")
+        peak, base_peak = max(data["memory_kb"]["peak"] or [0]), max(base["memory_kb"]["peak"] or [0])
+        if base_peak and peak > base_peak * (1 + tolerance):
+            regressions.append(f"{size}: peak memory {peak} KiB vs baseline {base_peak}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BeruBot dashboard routes.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated queue sizes (default: 50,1000,10000)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients per route")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of load per route")
+    parser.add_argument("--workers", type=int, default=1, help="dashboard worker processes")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown before a route counts as regressed")
+    parser.add_argument("--serve", nargs=2, metavar=("PORT", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(int(args.serve[0]), args.serve[1])
+        return
+
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), StubBotAPI)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    results = {}
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        print(f"queue size {size}:")
+        results[str(size)] = bench_size(size, args, stub_url)
+    stub.shutdown()
+
+    report = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "workers": args.workers,
+        "results": results,
+    }
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found. Run with --save-baseline to create one.")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("❌ Regressions against baseline:")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+    print("✅ No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+
+# Bulk admin actions, shared by the Telegram commands and the dashboard.
+#
+# Each action selects its targets and changes them under queue_lock with a
+# single save_queue(), so a batch is applied completely or not at all and
+# costs one disk write however many requests it touches. User notifications
+# are queued on the rate-limited notifier instead of being sent inline.
+
+import logging
+
+from store import request_queue, queue_lock, save_queue
+from notifier import notifier
+from records import Status
+import records
+import archive
+
+DONE_TEXT = "✅ Your request is completed."
+CANCELLED_TEXT = "❌ Your request was cancelled by an admin."
+
+listeners = []  # called as fn(record) for every request an action changes
+
+
+def _changed(records):
+    for r in records:
+        for listener in listeners:
+            listener(r)
+
+
+def select_pending(ids=None, count=None):
+    """Pending requests in queue order, optionally limited to ids and/or the first count."""
+    wanted = set(ids) if ids is not None else None
+    picked = [r for r in request_queue if r.status is Status.PENDING and (wanted is None or r.id in wanted)]
+    return picked[:count] if count is not None else picked
+
+
+def complete(ids=None, count=None):
+    """Marks pending requests done. Returns the completed records."""
+    with queue_lock:
+        done = select_pending(ids, count)
+        if not done:
+            return []
+        stamp = records.now()
+        for r in done:
+            r.status = Status.DONE
+            r.done_at = stamp
+        save_queue()
+    for r in done:
+        notifier.send(r.id, DONE_TEXT)
+    _changed(done)
+    logging.info(f"✅ Marked {len(done)} requests done.")
+    return done
+
+
+def cancel(ids):
+    """Removes pending requests of the given users. Returns the cancelled records."""
+    with queue_lock:
+        cancelled = select_pending(ids)
+        if not cancelled:
+            return []
+        # Removed in place: handlers append without queue_lock, and rebuilding
+        # the list here could drop a submission appended meanwhile.
+        for r in cancelled:
+            request_queue.remove(r)
+        for r in cancelled:
+            r.status = Status.CANCELLED
+        save_queue()
+    archive.append([archive.compact(r) for r in cancelled])
+    for r in cancelled:
+        notifier.send(r.id, CANCELLED_TEXT)
+    _changed(cancelled)
+    logging.info(f"❌ Cancelled {len(cancelled)} requests.")
+    return cancelled
+
+
+def message_pending(text, ids=None):
+    """Queues text for every pending user (or the given ones). Returns how many were queued."""
+    with queue_lock:
+        targets = [r.id for r in select_pending(ids)]
+    for uid in targets:
+        notifier.send(uid, text)
+    logging.info(f"📨 Queued a message for {len(targets)} pending users.")
+    return len(targets)
@@ -0,0 +1,109 @@
+
+# Table-driven routing of inline keyboard callbacks.
+#
+# callback_data is "<prefix>" or "<prefix>:<payload>". Each prefix is
+# registered once with the type its payload must parse as, so handlers get a
+# validated value instead of splitting strings themselves, and data that no
+# longer matches a route (old buttons, tampered payloads) is rejected in one
+# place. Every route keeps call counts and timings for /metrics.
+
+import time
+
+MAX_DATA_BYTES = 64  # Telegram's limit for callback_data
+
+
+class Route:
+    __slots__ = ("prefix", "handler", "parse", "admin_only", "calls", "errors", "rejected", "seconds")
+
+    def __init__(self, prefix, handler, parse, admin_only):
+        self.prefix = prefix
+        self.handler = handler
+        self.parse = parse
+        self.admin_only = admin_only
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+
+class CallbackRouter:
+    def __init__(self):
+        self.routes = {}
+        self.unknown = 0
+        self.is_admin = lambda user_id: False
+
+    def route(self, prefix, parse=None, admin_only=False):
+        """Registers handler(update, context, payload) for prefix.
+
+        parse turns the payload string into its typed value (int, ...) and may
+        raise ValueError; routes without parse take no payload.
+        """
+        if ":" in prefix:
+            raise ValueError("route prefixes cannot contain ':'")
+
+        def register(handler):
+            if prefix in self.routes:
+                raise ValueError(f"callback route {prefix!r} is already registered")
+            self.routes[prefix] = Route(prefix, handler, parse, admin_only)
+            return handler
+        return register
+
+    def data(self, prefix, payload=None):
+        """Builds callback_data for a registered route."""
+        route = self.routes[prefix]
+        if (payload is None) != (route.parse is None):
+            raise ValueError(f"route {prefix!r} {'takes no' if route.parse is None else 'needs a'} payload")
+        data = prefix if payload is None else f"{prefix}:{payload}"
+        if len(data.encode()) > MAX_DATA_BYTES:
+            raise ValueError(f"callback_data for {prefix!r} is longer than {MAX_DATA_BYTES} bytes")
+        return data
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        prefix, sep, raw = (query.data or "").partition(":")
+        route = self.routes.get(prefix)
+        if route is None:
+            self.unknown += 1
+            await query.answer("This button is no longer valid.")
+            return
+        try:
+            if route.parse is None:
+                if sep:
+                    raise ValueError("unexpected payload")
+                payload = None
+            else:
+                payload = route.parse(raw)
+        except ValueError:
+            route.rejected += 1
+            await query.answer("This button is no longer valid.")
+            return
+        if route.admin_only and not self.is_admin(query.from_user.id):
+            route.rejected += 1
+            await query.answer("Not authorized.")
+            return
+
+        await query.answer()
+        start = time.perf_counter()
+        route.calls += 1
+        try:
+            await route.handler(update, context, payload)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            route.seconds += time.perf_counter() - start
+
+    def metrics(self):
+        return {
+            "unknown": self.unknown,
+            "routes": {
+                r.prefix: {
+                    "calls": r.calls, "errors": r.errors, "rejected": r.rejected,
+                    "avg_ms": round(r.seconds / r.calls * 1000, 2) if r.calls else None,
+                }
+                for r in self.routes.values()
+            },
+        }
+
+
+router = CallbackRouter()
@@ -0,0 +1,115 @@
+
+# Intake capacity: at most MAX_REQUESTS new requests per window.
+#
+# "rolling" admits N requests in any CAPACITY_WINDOW_HOURS span; "calendar"
+# admits N per day, starting at CAPACITY_RESET_HOUR local time. Only admission
+# times are tracked, and old ones expire one by one, so the queue itself is
+# never cleared to make room. Cancelling does not hand a slot back, otherwise
+# cancel-and-resubmit would get around the limit.
+
+from datetime import datetime, timedelta
+from collections import deque
+import threading
+import logging
+import json
+import time
+import os
+
+from config import MAX_REQUESTS, CAPACITY_MODE, CAPACITY_WINDOW_HOURS, CAPACITY_RESET_HOUR
+from tenants import TenantLocal
+
+CAPACITY_FILE = "capacity.json"
+
+
+class CapacityManager:
+    def __init__(self, limit=MAX_REQUESTS, mode=CAPACITY_MODE, window_hours=CAPACITY_WINDOW_HOURS,
+                 reset_hour=CAPACITY_RESET_HOUR, state_file=CAPACITY_FILE):
+        if mode not in ("rolling", "calendar"):
+            raise ValueError("CAPACITY_MODE must be 'rolling' or 'calendar'")
+        self.limit = limit
+        self.mode = mode
+        self.window = window_hours * 3600
+        self.reset_hour = reset_hour
+        self.state_file = state_file
+        self.admissions = deque()
+        self.window_start = 0
+        self.lock = threading.Lock()
+
+    def current_window_start(self, now):
+        start = datetime.fromtimestamp(now).replace(hour=self.reset_hour, minute=0, second=0, microsecond=0)
+        if start.timestamp() > now:
+            start -= timedelta(days=1)
+        return start.timestamp()
+
+    def roll(self, now=None):
+        """Expires admissions that left the window. Returns how many slots opened up."""
+        now = now or time.time()
+        with self.lock:
+            before = len(self.admissions)
+            if self.mode == "rolling":
+                while self.admissions and self.admissions[0] <= now - self.window:
+                    self.admissions.popleft()
+            else:
+                start = self.current_window_start(now)
+                if start != self.window_start:
+                    self.window_start = start
+                    self.admissions.clear()
+            return before - len(self.admissions)
+
+    def used(self, now=None):
+        self.roll(now)
+        return len(self.admissions)
+
+    def remaining(self, now=None):
+        return max(0, self.limit - self.used(now))
+
+    def try_admit(self, now=None):
+        now = now or time.time()
+        self.roll(now)
+        with self.lock:
+            if len(self.admissions) >= self.limit:
+                return False
+            self.admissions.append(now)
+        self.save()
+        return True
+
+    def seconds_until_slot(self, now=None):
+        now = now or time.time()
+        if self.remaining(now):
+            return 0
+        with self.lock:
+            if self.mode == "rolling":
+                return max(0, self.admissions[0] + self.window - now)
+        next_start = datetime.fromtimestamp(self.current_window_start(now)) + timedelta(days=1)
+        return max(0, next_start.timestamp() - now)
+
+    def reset(self):
+        with self.lock:
+            self.admissions.clear()
+        self.save()
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            with self.lock:
+                self.admissions = deque(sorted(state.get("admissions", [])))
+                self.window_start = state.get("window_start", 0)
+        except Exception as e:
+            logging.error(f"❌ Failed to load capacity state: {e}")
+
+    def save(self):
+        with self.lock:
+            state = {"admissions": list(self.admissions), "window_start": self.window_start}
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            logging.error(f"❌ Failed to save capacity state: {e}")
+
+
+capacity = TenantLocal("capacity", lambda t: CapacityManager(limit=t.max_requests, state_file=t.path(CAPACITY_FILE)))
@@ -0,0 +1,40 @@
+
+# Environment configuration shared by the bot and the dashboard.
+# Kept free of heavy imports so it costs nothing at startup.
+
+import base64
+import os
+
+BOT_TOKEN = os.environ.get("BOT_TOKEN")
+ADMIN_ID = int(os.environ["ADMIN_ID"]) if os.environ.get("ADMIN_ID") else None
+GOOGLE_CREDENTIALS = os.environ.get("GOOGLE_CREDENTIALS")
+QUEUE_PASSWORD = os.environ.get("QUEUE_PASSWORD")
+UMAMI_URL = os.environ.get("UMAMI_URL")
+UMAMI_TOKEN = os.environ.get("UMAMI_TOKEN")
+UMAMI_SITE_ID = os.environ.get("UMAMI_SITE_ID")
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+UPDATE_RECORD_FILE = os.environ.get("UPDATE_RECORD_FILE")
+PORT = int(os.environ.get("PORT", 8080))
+# "embedded": the bot serves the dashboard on PORT from a thread. "external":
+# web.py serves it from its own processes and the bot only listens on
+# 127.0.0.1:CONTROL_PORT for the admin actions web.py forwards to it.
+DASHBOARD_MODE = os.environ.get("DASHBOARD_MODE", "embedded")
+CONTROL_PORT = int(os.environ.get("CONTROL_PORT", 8081))
+CREDS_FILE = "credentials.json"
+QUEUE_FILE = "queue.json"
+
+MAX_REQUESTS = int(os.environ.get("MAX_REQUESTS", 50))
+CAPACITY_MODE = os.environ.get("CAPACITY_MODE", "rolling")
+CAPACITY_WINDOW_HOURS = float(os.environ.get("CAPACITY_WINDOW_HOURS", 24))
+CAPACITY_RESET_HOUR = int(os.environ.get("CAPACITY_RESET_HOUR", 0))
+EDIT_TRACK_KEYWORD = "#behrupiyaedits"
+
+
+def credentials_file():
+    # Decoded on first use only; nothing at startup needs the Google credentials.
+    if not GOOGLE_CREDENTIALS:
+        return None
+    if not os.path.exists(CREDS_FILE):
+        with open(CREDS_FILE, "w") as f:
+            f.write(base64.b64decode(GOOGLE_CREDENTIALS).decode("utf-8"))
+    return CREDS_FILE
@@ -0,0 +1,483 @@
+
+# Web dashboard: landing page, public status and the password-protected admin
+# views. Imported lazily by main.py once the bot is already answering updates.
+
+from flask import (
+    Flask, Response, render_template_string, redirect, send_file, request, jsonify, stream_with_context
+)
+from urllib.parse import quote, urlencode
+import contextvars
+import logging
+import gzip
+import os
+
+from store import request_queue, queue_lock, reset_queue, queue_file
+from tenants import current, by_name, activate
+from analytics import track_umami_event
+from http_client import http
+from capacity import capacity
+from media_cache import media_cache
+from thumbnails import thumbnailer
+from photo_index import photo_index
+from callbacks import router
+from notifier import notifier
+from moderation import moderator
+from joins import joins
+from backpressure import backpressure
+import bulk_actions
+import lifecycle
+import eta
+from queue_import import import_queue
+import archive
+from queue_export import export_queue, parse_bound, FORMATS as EXPORT_FORMATS
+from search import search_index
+
+flask_app = Flask(__name__)
+
+
+class TenantIterable:
+    """Runs the response iterator in the tenant's context, for streamed responses."""
+
+    def __init__(self, ctx, result):
+        self.ctx = ctx
+        self.result = result
+        self.it = iter(result)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.ctx.run(next, self.it)
+
+    def close(self):
+        if hasattr(self.result, "close"):
+            self.ctx.run(self.result.close)
+
+
+class TenantMiddleware:
+    """Serves /t/<name>/... for tenant <name>; unprefixed paths belong to the first tenant."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if not path.startswith("/t/"):
+            return self.app(environ, start_response)
+        name, _, rest = path[3:].partition("/")
+        tenant = by_name.get(name)
+        if tenant is None:
+            start_response("404 NOT FOUND", [("Content-Type", "text/plain")])
+            return [b"Unknown tenant."]
+        environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + "/t/" + name
+        environ["PATH_INFO"] = "/" + rest
+        # A fresh context per request, thrown away afterwards, so nothing needs resetting.
+        ctx = contextvars.Context()
+        ctx.run(activate, tenant)
+        result = ctx.run(self.app, environ, start_response)
+        return TenantIterable(ctx, result)
+
+
+flask_app.wsgi_app = TenantMiddleware(flask_app.wsgi_app)
+MEDIA_MAX_AGE = 365 * 24 * 3600  # cached files never change for a given file_unique_id
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+TEMPLATE = """<!doctype html><title>Queue</title><h2>Queue ({{ total }}) · intake {{ capacity_used }}/{{ max_requests }}</h2>
+<form method="get" action="{{ request.script_root }}/adminbeh"><input type="hidden" name="password" value="{{ password }}">
+<input name="q" value="{{ args.q or '' }}" placeholder="Caption or username words">
+<input name="user" value="{{ args.user or '' }}" placeholder="Username">
+<select name="status"><option value="">any status</option>{% for s in ['pending', 'done', 'cancelled'] %}<option{% if args.status == s %} selected{% endif %}>{{ s }}</option>{% endfor %}</select>
+<input name="since" value="{{ args.since or '' }}" placeholder="From YYYY-MM-DD" size="12">
+<input name="until" value="{{ args.until or '' }}" placeholder="To YYYY-MM-DD" size="12">
+<select name="source">{% for s in ['live', 'archive', 'all'] %}<option{% if args.source == s %} selected{% endif %}>{{ s }}</option>{% endfor %}</select>
+<button>Search</button></form>
+<p>Showing {{ first }}–{{ last }} of {{ total }}.
+{% if prev_url %}<a href="{{ prev_url }}">« Previous</a>{% endif %} {% if next_url %}<a href="{{ next_url }}">Next »</a>{% endif %}</p>
+<form method="post" action="{{ request.script_root }}/bulk"><input type="hidden" name="password" value="{{ password }}"><input type="hidden" name="redirect" value="1">
+<button name="action" value="done">Mark selected done</button>
+<button name="action" value="cancel" onclick="return confirm('Cancel the selected requests?')">Cancel selected</button>
+<input name="text" placeholder="Message to selected (or all pending)"> <button name="action" value="message">Send message</button><ul>
+{% for r in queue %}
+<li>{% if r.status == 'pending' %}<input type="checkbox" name="ids" value="{{ r.id }}"> {% endif %}<b>{{ r.name }}</b> - {{ r.type }} - <i>{{ r.status }}</i><br>
+{% if r.type == 'photo' %}
+{% if thumbnails %}<a href="{{ request.script_root }}/media/{{ r.photo_uid or r.photo_id }}?password={{ password|urlencode }}" target="_blank"><img src="{{ request.script_root }}/thumb/{{ r.photo_uid or r.photo_id }}?password={{ password|urlencode }}" loading="lazy" alt="{{ r.name }}" style="max-width:160px;max-height:160px"></a><br>{% endif %}
+<a href="{{ request.script_root }}/media/{{ r.photo_uid or r.photo_id }}?password={{ password|urlencode }}" target="_blank">Download</a><br>
+<i>{{ r.caption }}</i>
+{% for m in r.duplicates %}<br>⚠️ Looks like <b>{{ m.name }}</b>'s photo (distance {{ m.distance }}) <a href="{{ request.script_root }}/media/{{ m.uid }}?password={{ password|urlencode }}" target="_blank">compare</a>{% endfor %}
+{% endif %}</li><hr>
+{% endfor %}</ul></form>
+"""
+
+
+USER_TEMPLATE = """
+<!doctype html>
+<title>Queue Status</title>
+<h2>Current Queue ({{ queue|length }})</h2>
+<table border="1" cellspacing="0" cellpadding="5">
+    <tr>
+        <th>#</th>
+        <th>User</th>
+        <th>Status</th>
+        <th>Expected Delivery</th>
+    </tr>
+    {% for r in queue %}
+    <tr>
+        <td>{{ loop.index }}</td>
+        <td>{{ r.name }}</td>
+        <td>{{ r.status }}</td>
+        <td>{{ r.expected }}</td>
+    </tr>
+    {% endfor %}
+</table>
+"""
+
+LANDING_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <title>BeruBot – Behrupiya Edits</title>
+  <style>
+    body {
+      background-color: #000;
+      color: #fff;
+      font-family: 'Courier New', Courier, monospace;
+      padding: 40px;
+      text-align: center;
+    }
+    h1 {
+      font-size: 2.5em;
+      margin-bottom: 10px;
+    }
+    p {
+      font-size: 1.1em;
+      margin: 10px auto;
+      max-width: 600px;
+    }
+    ul {
+      list-style: none;
+      padding: 0;
+      margin: 20px 0;
+    }
+    ul li {
+      background: #111;
+      margin: 10px auto;
+      padding: 10px 20px;
+      border: 1px solid #333;
+      max-width: 400px;
+      border-radius: 6px;
+    }
+    a {
+      color: #fff;
+      background: #333;
+      padding: 10px 20px;
+      text-decoration: none;
+      border-radius: 6px;
+      display: inline-block;
+      margin: 10px;
+      transition: background 0.3s ease;
+    }
+    a:hover {
+      background: #fff;
+      color: #000;
+    }
+    hr {
+      margin: 30px auto;
+      width: 60%;
+      border: 1px solid #444;
+    }
+  </style>
+</head>
+<body>
+  <h1>Welcome to Behrupiya Edits 💀</h1>
+  <p>BeruBot is your NSFW fantasy image editing genie.</p>
+  <ul>
+    <li>💥 Realistic edits of your wildest dreams</li>
+    <li>🔞 NSFW with a purpose — Respect in Real Life</li>
+    <li>⏱️ Free queue: 24–48hr SLA</li>
+    <li>⚡ Fast delivery: Paid options available</li>
+  </ul>
+  <a href="https://t.me/behrupiya_bot" target="_blank">👉 Chat with BeruBot on Telegram</a>
+  <hr>
+  <a href="{{ request.script_root }}/status">View Public Queue</a>
+</body>
+</html>
+"""
+
+
+@flask_app.route("/")
+def landing_page():
+    return render_template_string(LANDING_TEMPLATE)
+
+
+# @flask_app.route("/adminbeh")
+# def admin_queue():
+#     display = []
+#     for r in request_queue:
+#         item = r.copy()
+#         if r["type"] == "photo":
+#             try:
+#                 f = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={r['photo_id']}").json()
+#                 item["file_path"] = f["result"]["file_path"]
+#             except:
+#                 item["file_path"] = ""
+#         display.append(item)
+#     return render_template_string(TEMPLATE, queue=display, bot_token=BOT_TOKEN, max_requests=MAX_REQUESTS)
+
+
+@flask_app.route("/adminbeh")
+def admin_queue():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    args = request.args
+    try:
+        statuses = {s for s in args.get("status", "").split(",") if s}
+        matches = search_index.search(
+            q=args.get("q"), user=args.get("user"), statuses=statuses,
+            since=parse_bound(args.get("since")), until=parse_bound(args.get("until"), end=True),
+            source=args.get("source", "live"),
+        )
+        page = max(1, int(args.get("page", 1)))
+        per_page = min(MAX_PAGE_SIZE, max(1, int(args.get("per_page", PAGE_SIZE))))
+    except ValueError as e:
+        return str(e), 400
+
+    start = (page - 1) * per_page
+    display = [r.view(duplicates=photo_index.duplicates(r.photo_uid)) for r in matches[start:start + per_page]]
+
+    def page_url(n):
+        return f"{request.script_root}/adminbeh?{urlencode({**args.to_dict(), 'page': n})}"
+
+    return render_template_string(
+        TEMPLATE, queue=display, password=pwd, thumbnails=thumbnailer.enabled,
+        max_requests=capacity.limit, capacity_used=capacity.used(), args=args,
+        total=len(matches), first=start + 1 if display else 0, last=start + len(display),
+        prev_url=page_url(page - 1) if page > 1 else None,
+        next_url=page_url(page + 1) if start + per_page < len(matches) else None,
+    )
+
+
+def resolve_media(key):
+    """Returns (file_unique_id, cached path) for a media key, fetching it if needed."""
+    path = media_cache.get(key)
+    if path:
+        return key, path
+    # Not prefetched (older entry, or evicted): fetch it once, then it's local.
+    r = next((r for r in request_queue if key in (r.photo_uid, r.photo_id)), None)
+    if not r:
+        return None, None
+    try:
+        uid = media_cache.fetch_sync(r.photo_id)
+    except Exception as e:
+        logging.warning(f"🖼️ Media fetch failed for {key}: {e}")
+        return r.photo_uid, None
+    # This runs on a dashboard thread; the bot changes queue records under queue_lock.
+    with queue_lock:
+        r.photo_uid = uid
+    return uid, media_cache.get(uid)
+
+
+@flask_app.route("/media/<key>")
+def media(key):
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    uid, path = resolve_media(key)
+    if not path:
+        return ("Media unavailable.", 502) if uid else ("Not found.", 404)
+
+    # conditional=True answers Range and If-None-Match requests; servers that provide
+    # wsgi.file_wrapper (gunicorn) hand the file to sendfile() without copying it.
+    response = send_file(os.path.abspath(path), mimetype="image/jpeg", conditional=True,
+                         max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
+
+@flask_app.route("/thumb/<key>")
+def thumb(key):
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    path = thumbnailer.get(key)
+    if not path:
+        uid, src = resolve_media(key)
+        # The resize runs in the thumbnail process pool; this thread only waits for it.
+        path = thumbnailer.ensure(uid, src) if src else None
+    if not path:
+        return "Not found.", 404
+
+    response = send_file(os.path.abspath(path), mimetype="image/jpeg", conditional=True, max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+# @flask_app.route("/")
+# def index():
+#     display = []
+#     for r in request_queue:
+#         item = r.copy()
+#         if r["type"] == "photo":
+#             try:
+#                 f = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={r['photo_id']}").json()
+#                 item["file_path"] = f["result"]["file_path"]
+#             except: item["file_path"] = ""
+#         display.append(item)
+#     return render_template_string(TEMPLATE, queue=display, bot_token=BOT_TOKEN, max_requests=MAX_REQUESTS)
+
+# @flask_app.route("/reset", methods=["GET", "POST"])
+# def reset(): reset_queue(); return redirect("/")
+
+@flask_app.route("/reset", methods=["GET", "POST"])
+def reset():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        logging.warning(f"❌ Unauthorized queue reset attempt! IP: {request.remote_addr}")
+        return "Unauthorized", 401
+
+    logging.warning(f"⚠️ Queue reset triggered! IP: {request.remote_addr}")
+    track_umami_event("queue_reset", {
+        "by": "web",
+        "ip": request.remote_addr
+    })
+    
+    reset_queue()
+    capacity.reset()
+    return redirect(request.script_root + "/")
+
+@flask_app.route("/download-queue")
+def download_queue():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    if os.path.exists(queue_file()):
+        return send_file(os.path.abspath(queue_file()), as_attachment=True)
+    return "No queue file found.", 404
+
+
+@flask_app.route("/export-queue")
+def export_queue_route():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    fmt = request.args.get("format", "ndjson")
+    statuses = {s for s in request.args.get("status", "").split(",") if s}
+    compress = request.accept_encodings["gzip"] > 0  # honours q-values, so gzip;q=0 opts out
+    try:
+        body = export_queue(fmt, statuses, request.args.get("since"), request.args.get("until"), compress,
+                            source=request.args.get("source", "live"))
+    except ValueError as e:
+        return str(e), 400
+
+    headers = {"Content-Disposition": f"attachment; filename=queue.{fmt}"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+
+@flask_app.route("/history")
+def history():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    user = request.args.get("user")
+    if user is not None and not user.lstrip("-").isdigit():
+        return "user must be a numeric Telegram id", 400
+    return jsonify(archive.history(int(user) if user is not None else None))
+
+
+@flask_app.route("/metrics")
+def metrics():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized. Invalid password.", 401
+
+    return jsonify({
+        "callbacks": router.metrics(),
+        "notifications": {"sent": notifier.sent, "failed": notifier.failed, "pending": notifier.pending()},
+        "media_cache": {"hits": media_cache.hits, "misses": media_cache.misses},
+        "moderation": moderator.stats,
+        "joins": joins.stats,
+        "updates": lifecycle.metrics(),
+        "search": search_index.metrics(),
+        "load": backpressure.metrics(),
+        "http": http.metrics(),
+    })
+
+
+@flask_app.route("/restore-queue", methods=["POST"])
+def restore_queue():
+    pwd = request.args.get("password")
+    if pwd != current().password:
+        return "Unauthorized", 401
+
+    stream = request.stream
+    if request.headers.get("Content-Encoding") == "gzip":
+        stream = gzip.GzipFile(fileobj=stream)
+    try:
+        summary = import_queue(
+            stream,
+            mode=request.args.get("mode", "replace"),
+            skip_invalid=request.args.get("skip_invalid") in ("1", "true")
+        )
+    except (ValueError, OSError, EOFError) as e:
+        return jsonify({"applied": False, "error": str(e)}), 400
+
+    logging.warning(f"⚠️ Queue restore ({summary['mode']}): {summary['imported']} imported, "
+                    f"{summary['invalid']} invalid. IP: {request.remote_addr}")
+    return jsonify(summary), 200 if summary["applied"] else 400
+
+
+@flask_app.route("/bulk", methods=["POST"])
+def bulk():
+    pwd = request.values.get("password")
+    if pwd != current().password:
+        return "Unauthorized", 401
+
+    action = request.values.get("action")
+    try:
+        ids = [int(i) for v in request.values.getlist("ids") for i in v.split(",") if i.strip()] or None
+        count = request.values.get("count", type=int)
+    except ValueError:
+        return jsonify({"error": "ids must be integers"}), 400
+    everyone = request.values.get("all") in ("1", "true")
+    if action == "done":
+        # Never complete the whole queue because nothing was selected.
+        if ids is None and count is None and not everyone:
+            return jsonify({"error": "pass ids, count or all=1"}), 400
+        affected = len(bulk_actions.complete(ids, count))
+    elif action == "cancel":
+        if ids is None:
+            return jsonify({"error": "pass ids"}), 400
+        affected = len(bulk_actions.cancel(ids))
+    elif action == "message":
+        text = (request.values.get("text") or "").strip()
+        if not text:
+            return jsonify({"error": "text is required"}), 400
+        affected = bulk_actions.message_pending(text, ids)
+    else:
+        return jsonify({"error": "action must be done, cancel or message"}), 400
+
+    logging.warning(f"⚠️ Bulk {action} from dashboard: {affected} requests. IP: {request.remote_addr}")
+    if request.values.get("redirect"):
+        return redirect(f"{request.script_root}/adminbeh?password={quote(pwd)}")
+    return jsonify({"action": action, "affected": affected})
+
+
+@flask_app.route("/status")
+def public_status():
+    positions = eta.pending_positions()
+    display = [r.view(expected=eta.describe(r, positions)) for r in list(request_queue)]
+    return render_template_string(USER_TEMPLATE, queue=display)
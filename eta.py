@@ -0,0 +1,121 @@
+
+# Delivery estimates from our actual completion pace.
+#
+# Completions are counted in hourly buckets over a rolling ETA_WINDOW_DAYS
+# window. The buckets form a ring with a running total, so recording a done
+# event and reading the rate are O(1) (stale hours are cleared as the clock
+# moves forward). A pending request's ETA is its position among pending
+# requests divided by that rate. Until there is enough history, the old fixed
+# 48-hour expectation is used.
+
+from datetime import datetime, timedelta
+import threading
+import logging
+import time
+import os
+
+from store import request_queue
+from tenants import TenantLocal
+from records import Status
+import records
+import archive
+
+BUCKET_SECONDS = 3600
+WINDOW_DAYS = float(os.environ.get("ETA_WINDOW_DAYS", 7))
+MIN_SAMPLES = 5
+FALLBACK = timedelta(hours=48)
+DISPLAY_FORMAT = "%b %d, %I:%M %p"
+
+
+class EtaEstimator:
+    def __init__(self, window_days=WINDOW_DAYS):
+        self.size = max(1, int(window_days * 24 * 3600 // BUCKET_SECONDS))
+        self.counts = [0] * self.size
+        self.total = 0
+        self.head = None  # newest bucket number seen
+        self.first = None  # time of the oldest completion still counted
+        self.seeded_until = None  # completions stamped before this come from load(), later ones from on_change()
+        self.lock = threading.Lock()
+
+    def _advance(self, bucket):
+        # Called with self.lock held. Clears buckets that fell out of the window.
+        if self.head is None:
+            self.head = bucket
+            return
+        for b in range(self.head + 1, min(bucket, self.head + self.size) + 1):
+            slot = b % self.size
+            self.total -= self.counts[slot]
+            self.counts[slot] = 0
+        self.head = max(self.head, bucket)
+        if self.total == 0:
+            self.first = None
+
+    def record(self, ts=None):
+        """Counts one completion at ts (default now)."""
+        ts = ts or time.time()
+        bucket = int(ts // BUCKET_SECONDS)
+        with self.lock:
+            self._advance(bucket)
+            if bucket <= self.head - self.size:
+                return
+            self.counts[bucket % self.size] += 1
+            self.total += 1
+            self.first = ts if self.first is None else min(self.first, ts)
+
+    def rate(self, now=None):
+        """Completions per second over the window, or None without enough history."""
+        now = now or time.time()
+        with self.lock:
+            self._advance(int(now // BUCKET_SECONDS))
+            if self.total < MIN_SAMPLES:
+                return None
+            span = min(self.size * BUCKET_SECONDS, max(BUCKET_SECONDS, now - self.first))
+            return self.total / span
+
+    def load(self):
+        """Seeds the window from archived and queued completions stamped before the call."""
+        with self.lock:
+            self.seeded_until = until = records.now()
+        cutoff = time.time() - self.size * BUCKET_SECONDS
+        done = [r.closed_at for r in archive.iter_archive() if r.status is Status.DONE]
+        # The queue is read once, after the (slow) archive: requests swept into the
+        # archive meanwhile are not counted twice, nor are live completions.
+        done += [r.done_at for r in list(request_queue) if r.status is Status.DONE]
+        seeded = 0
+        for ts in done:
+            if ts is not None and cutoff < ts < until:
+                self.record(ts)
+                seeded += 1
+        logging.info(f"⏱️ ETA window seeded with {seeded} completions.")
+
+    def on_change(self, record):
+        # Earlier completions are (or will be) counted by load(), from the queue.
+        if record.status is Status.DONE and self.seeded_until is not None \
+                and (record.done_at or 0) >= self.seeded_until:
+            self.record(record.done_at)
+
+    def estimate(self, position, submitted=None, now=None):
+        """Expected delivery for the request at 1-based position among pending ones (submitted: epoch)."""
+        now = now or time.time()
+        rate = self.rate(now)
+        if rate is None:
+            return datetime.fromtimestamp(submitted) + FALLBACK if submitted is not None else None
+        return datetime.fromtimestamp(now + position / rate)
+
+
+def pending_positions():
+    """Maps user id -> 1-based position among pending requests, in queue order."""
+    ids = [r.id for r in list(request_queue) if r.status is Status.PENDING]
+    return {uid: i for i, uid in enumerate(ids, 1)}
+
+
+def describe(record, positions=None):
+    """Human-readable ETA for a queue entry, e.g. 'Oct 21, 02:00 PM'."""
+    if record.status is not Status.PENDING:
+        return "Delivered" if record.status is Status.DONE else "Unknown"
+    position = (positions or pending_positions()).get(record.id)
+    when = estimator.estimate(position, record.timestamp) if position else None
+    return when.strftime(DISPLAY_FORMAT) if when else "Unknown"
+
+
+estimator = TenantLocal("eta", lambda t: EtaEstimator())
@@ -0,0 +1,197 @@
+
+# Shared outbound HTTP.
+#
+# Everything that talks HTTP outside of PTB (Umami, direct Bot API file
+# fetches from the dashboard) goes through one keep-alive pool per process,
+# in two forms: request() for threads (requests) and arequest() for the event
+# loop (httpx). Both apply the same timeouts, retry idempotent calls on
+# connection errors and 429/5xx with backoff, cap concurrent calls per host
+# and record per-host latency for /metrics.
+#
+# PTB keeps its own HTTPXRequest pools for the Bot API; their sizes and
+# timeouts are set here too (see telegram_request_settings()).
+
+from collections import deque
+from urllib.parse import urlsplit
+import threading
+import asyncio
+import time
+import os
+
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))  # keep-alive connections per host
+HTTP_HOST_CONCURRENCY = int(os.environ.get("HTTP_HOST_CONCURRENCY", 8))
+HTTP_KEEPALIVE = float(os.environ.get("HTTP_KEEPALIVE", 30))
+
+TG_POOL_SIZE = int(os.environ.get("TG_POOL_SIZE", 256))
+TG_POOL_TIMEOUT = float(os.environ.get("TG_POOL_TIMEOUT", 1))
+TG_CONNECT_TIMEOUT = float(os.environ.get("TG_CONNECT_TIMEOUT", 5))
+TG_READ_TIMEOUT = float(os.environ.get("TG_READ_TIMEOUT", 5))
+TG_WRITE_TIMEOUT = float(os.environ.get("TG_WRITE_TIMEOUT", 20))  # photo uploads
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+BACKOFF = 0.5
+LATENCY_SAMPLES = 200
+
+
+class HostStats:
+    __slots__ = ("calls", "errors", "retries", "in_flight", "total", "max", "recent")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, seconds, ok):
+        self.calls += 1
+        self.errors += not ok
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        pick = lambda q: round(recent[min(len(recent) - 1, int(len(recent) * q))] * 1000, 1) if recent else None
+        return {
+            "calls": self.calls, "errors": self.errors, "retries": self.retries, "in_flight": self.in_flight,
+            "mean_ms": round(self.total / self.calls * 1000, 1) if self.calls else None,
+            "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(self.max * 1000, 1),
+        }
+
+
+class HttpClient:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}  # host -> HostStats
+        self.thread_slots = {}  # host -> BoundedSemaphore
+        self.loop_slots = {}  # host -> asyncio.Semaphore
+        self._session = None
+        self._async_client = None
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostStats()
+                self.thread_slots[host] = threading.BoundedSemaphore(HTTP_HOST_CONCURRENCY)
+        return host, self.hosts[host]
+
+    def _attempts(self, method, retry):
+        return 1 + HTTP_RETRIES if (retry if retry is not None else method.upper() in IDEMPOTENT) else 1
+
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self.lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, method, url, retry=None, **kwargs):
+        """Blocking request through the shared pool. retry defaults to idempotent methods only.
+
+        With stream=True the host slot is released once headers arrive; close the response.
+        """
+        import requests
+
+        host, stats = self._host(url)
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT))
+        attempts = self._attempts(method, retry)
+        with self.thread_slots[host]:
+            for attempt in range(1, attempts + 1):
+                started = time.perf_counter()
+                stats.in_flight += 1
+                try:
+                    res = self.session().request(method, url, **kwargs)
+                except requests.RequestException:
+                    stats.record(time.perf_counter() - started, ok=False)
+                    if attempt == attempts:
+                        raise
+                else:
+                    stats.record(time.perf_counter() - started, ok=res.status_code < 500)
+                    if res.status_code not in RETRY_STATUSES or attempt == attempts:
+                        return res
+                    res.close()
+                finally:
+                    stats.in_flight -= 1
+                stats.retries += 1
+                time.sleep(BACKOFF * 2 ** (attempt - 1))
+
+    def async_client(self):
+        if self._async_client is None:
+            import httpx
+
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_SIZE, keepalive_expiry=HTTP_KEEPALIVE),
+            )
+        return self._async_client
+
+    async def arequest(self, method, url, retry=None, **kwargs):
+        """The same as request(), awaited on the event loop."""
+        import httpx
+
+        host, stats = self._host(url)
+        slot = self.loop_slots.get(host)
+        if slot is None:
+            slot = self.loop_slots[host] = asyncio.Semaphore(HTTP_HOST_CONCURRENCY)
+        attempts = self._attempts(method, retry)
+        async with slot:
+            for attempt in range(1, attempts + 1):
+                started = time.perf_counter()
+                stats.in_flight += 1
+                try:
+                    res = await self.async_client().request(method, url, **kwargs)
+                except httpx.HTTPError:
+                    stats.record(time.perf_counter() - started, ok=False)
+                    if attempt == attempts:
+                        raise
+                else:
+                    stats.record(time.perf_counter() - started, ok=res.status_code < 500)
+                    if res.status_code not in RETRY_STATUSES or attempt == attempts:
+                        return res
+                finally:
+                    stats.in_flight -= 1
+                stats.retries += 1
+                await asyncio.sleep(BACKOFF * 2 ** (attempt - 1))
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self.loop_slots.clear()
+
+    def metrics(self):
+        with self.lock:
+            hosts = dict(self.hosts)
+        return {
+            "hosts": {host: stats.summary() for host, stats in hosts.items()},
+            "pool": {"size": HTTP_POOL_SIZE, "per_host": HTTP_HOST_CONCURRENCY,
+                     "timeout": HTTP_TIMEOUT, "retries": HTTP_RETRIES},
+            "telegram": telegram_request_settings(),
+        }
+
+
+def telegram_request_settings():
+    """Keyword arguments for PTB's HTTPXRequest used for Bot API calls."""
+    return {
+        "connection_pool_size": TG_POOL_SIZE, "pool_timeout": TG_POOL_TIMEOUT,
+        "connect_timeout": TG_CONNECT_TIMEOUT, "read_timeout": TG_READ_TIMEOUT,
+        "write_timeout": TG_WRITE_TIMEOUT,
+    }
+
+
+http = HttpClient()
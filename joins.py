@@ -0,0 +1,162 @@
+
+# Join/leave handling in groups, aggregated per chat.
+#
+# Join and leave service messages are collected per chat for JOIN_WINDOW
+# seconds. Each window then produces one combined welcome (naming up to
+# WELCOME_MENTIONS new members and counting the rest), one aggregated Umami
+# membership event, and deleteMessages calls for the service messages, instead
+# of one welcome, one deletion and one analytics POST per member. After a
+# welcome, the latest admin post is forwarded again, at most once per
+# RESHARE_COOLDOWN seconds (the reshare from old1_main.py, now per chat).
+# Under load (backpressure.py) the window is extended, up to
+# MAX_WELCOME_DEFER seconds, so one later welcome covers everyone. Each bot
+# has its own aggregator and last-admin file under its data dir.
+
+import logging
+import asyncio
+import json
+import time
+import os
+
+from analytics import track
+from backpressure import backpressure, WELCOMES
+from tenants import TenantLocal
+
+JOIN_WINDOW = float(os.environ.get("JOIN_WINDOW", 5))
+RESHARE_COOLDOWN = float(os.environ.get("RESHARE_COOLDOWN", 60))
+MAX_WELCOME_DEFER = float(os.environ.get("MAX_WELCOME_DEFER", 120))
+WELCOME_MENTIONS = 10
+EVENT_USERS = 50  # users listed in one analytics event
+DELETE_BATCH = 100
+LAST_ADMIN_FILE = "last_admin.json"
+
+
+def display_name(user):
+    return f"@{user.username}" if user.username else user.full_name
+
+
+class ChatJoins:
+    __slots__ = ("joined", "left", "service_ids", "flush_task")
+
+    def __init__(self):
+        self.joined = []
+        self.left = []
+        self.service_ids = []
+        self.flush_task = None
+
+
+class JoinAggregator:
+    def __init__(self, send_welcome=None, state_file=LAST_ADMIN_FILE):
+        self.send_welcome = send_welcome  # async fn(bot, chat_id, text); main sets send_temp_message
+        self.state_file = state_file
+        self.chats = {}
+        self.last_admin = None  # chat_id -> message id of the latest admin post
+        self.last_reshare = {}
+        self.stats = {"joined": 0, "left": 0, "welcomes": 0, "events": 0, "reshares": 0}
+
+    def add(self, bot, message):
+        state = self.chats.setdefault(message.chat.id, ChatJoins())
+        if message.new_chat_members:
+            state.joined.extend(m for m in message.new_chat_members if not m.is_bot)
+        if message.left_chat_member:
+            state.left.append(message.left_chat_member)
+        state.service_ids.append(message.message_id)
+        if state.flush_task is None:
+            state.flush_task = asyncio.create_task(self.flush_later(bot, message.chat.id, state))
+
+    async def flush_later(self, bot, chat_id, state):
+        try:
+            await asyncio.sleep(JOIN_WINDOW)
+            deferred = 0
+            while deferred < MAX_WELCOME_DEFER and backpressure.shedding(WELCOMES):
+                await asyncio.sleep(JOIN_WINDOW)
+                deferred += JOIN_WINDOW
+        finally:
+            # Also runs when cancelled at shutdown, so nothing collected is lost.
+            state.flush_task = None
+            await self.flush(bot, chat_id, state)
+
+    async def flush(self, bot, chat_id, state):
+        joined, left, ids = state.joined, state.left, state.service_ids
+        state.joined, state.left, state.service_ids = [], [], []
+        self.stats["joined"] += len(joined)
+        self.stats["left"] += len(left)
+
+        for i in range(0, len(ids), DELETE_BATCH):
+            try:
+                await bot.delete_messages(chat_id, ids[i:i + DELETE_BATCH])
+            except Exception as e:
+                logging.warning(f"👥 Could not delete service messages in {chat_id}: {e}")
+
+        if joined or left:
+            self.stats["events"] += 1
+            data = {
+                "chat_id": chat_id, "joined": len(joined), "left": len(left),
+                "joined_users": [{"username": display_name(u), "user_id": u.id} for u in joined[:EVENT_USERS]],
+                "left_users": [{"username": display_name(u), "user_id": u.id} for u in left[:EVENT_USERS]],
+            }
+            track("membership", data)
+
+        if joined:
+            names = ", ".join(display_name(u) for u in joined[:WELCOME_MENTIONS])
+            if len(joined) > WELCOME_MENTIONS:
+                names += f" and {len(joined) - WELCOME_MENTIONS} others"
+            self.stats["welcomes"] += 1
+            await self.send_welcome(
+                bot, chat_id,
+                f"👋 Welcome {names}!\n\n"
+                "📸 This group is for image editing requests only.\n"
+                "To request an edit, DM the bot."
+            )
+            await self.reshare(bot, chat_id)
+
+    async def reshare(self, bot, chat_id):
+        now = time.monotonic()
+        if now - self.last_reshare.get(chat_id, -RESHARE_COOLDOWN) < RESHARE_COOLDOWN:
+            return
+        msg_id = self.admin_post(chat_id)
+        if not msg_id:
+            return
+        try:
+            await bot.forward_message(chat_id=chat_id, from_chat_id=chat_id, message_id=msg_id)
+            self.last_reshare[chat_id] = now
+            self.stats["reshares"] += 1
+        except Exception as e:
+            logging.warning(f"⚠️ Failed to forward admin message: {e}")
+
+    def admin_post(self, chat_id):
+        if self.last_admin is None:
+            self.last_admin = {}
+            if os.path.exists(self.state_file):
+                try:
+                    with open(self.state_file, "r") as f:
+                        state = json.load(f)
+                    # old1_main.py kept a single id for the one group it served.
+                    if "last_admin_message_id" in state:
+                        state = {"*": state["last_admin_message_id"]}
+                    self.last_admin = {k if k == "*" else int(k): v for k, v in state.items()}
+                except Exception as e:
+                    logging.error(f"❌ Failed to load {self.state_file}: {e}")
+        return self.last_admin.get(chat_id) or self.last_admin.get("*")
+
+    def note_admin_post(self, chat_id, message_id):
+        self.admin_post(chat_id)
+        self.last_admin[chat_id] = message_id
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({str(k): v for k, v in self.last_admin.items()}, f)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            logging.error(f"❌ Failed to save {self.state_file}: {e}")
+
+    async def drain(self):
+        tasks = [s.flush_task for s in self.chats.values() if s.flush_task]
+        # A task cancelled before it first runs would skip its finally block.
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+joins = TenantLocal("joins", lambda t: JoinAggregator(state_file=t.path(LAST_ADMIN_FILE)))
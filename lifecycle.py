@@ -0,0 +1,161 @@
+
+# Coordinated shutdown and restart.
+#
+# Subsystems with background work register a drain hook; on shutdown the hooks
+# run once intake has stopped and in-flight handlers have finished.
+#
+# Updates are applied at most once across restarts and crashes. When an
+# update's handlers have finished, its id is committed, together with a
+# bounded list of recently answered callback queries; commits are written to
+# the handoff file in batches, at most COMMIT_DELAY seconds apart, and on
+# shutdown. Telegram re-delivers anything it did not see acknowledged, and
+# those updates are dropped before any handler runs. Queue records also carry
+# the update that created them, so a crash before a commit reaches the disk
+# does not bring a submission back either.
+#
+# Only ids just below the last commit count as re-deliveries. Telegram starts
+# over from a random id after a week without updates, and a data dir may be
+# reused with another bot; an id far below the last commit starts fresh state.
+
+from collections import deque
+import logging
+import asyncio
+import json
+import time
+import os
+
+from tenants import TenantLocal
+
+HANDOFF_FILE = "handoff.json"
+DRAIN_TIMEOUT = 20
+RECENT_CALLBACKS = 200
+REDELIVERY_WINDOW = 100_000  # how far below the last commit a re-delivered id can be
+COMMIT_DELAY = 1.0
+
+drain_hooks = []
+restart_requested = False
+
+
+def register_drain(name, hook):
+    """hook is a plain or async callable; hooks run in registration order."""
+    drain_hooks.append((name, hook))
+
+
+async def drain():
+    for name, hook in drain_hooks:
+        t = time.perf_counter()
+        try:
+            result = hook()
+            if asyncio.iscoroutine(result):
+                await asyncio.wait_for(result, DRAIN_TIMEOUT)
+            logging.info(f"🧹 Drained {name} in {(time.perf_counter() - t) * 1000:.0f}ms")
+        except Exception as e:
+            logging.error(f"❌ Failed to drain {name}: {e}")
+
+
+class Handoff:
+    """Update ids of one bot: the last one committed, and where the previous process stopped."""
+
+    def __init__(self, path=HANDOFF_FILE):
+        self.path = path
+        self.last_update_id = 0
+        self.handoff_update_id = 0
+        self.recent_callbacks = deque(maxlen=RECENT_CALLBACKS)
+        self.skipped = 0
+        self.commits = 0
+        self.resets = 0
+        self.write_pending = None  # timer handle of the next batched write
+
+
+handoff = TenantLocal("handoff", lambda t: Handoff(t.path(HANDOFF_FILE)))
+
+
+def note_update(update_id, callback_id=None):
+    """Returns False if the update, or the callback press it carries, was already applied."""
+    state = handoff.local()
+    if update_id <= state.last_update_id - REDELIVERY_WINDOW:
+        logging.warning(f"🔁 Update {update_id} is far below the last committed {state.last_update_id}; "
+                        "Telegram restarted its ids or this is another bot. Starting fresh.")
+        state.last_update_id = state.handoff_update_id = 0
+        state.recent_callbacks.clear()
+        state.resets += 1
+    # Updates are handled one at a time, so everything up to the last commit is done.
+    if update_id <= state.last_update_id or (callback_id and callback_id in state.recent_callbacks):
+        state.skipped += 1
+        return False
+    return True
+
+
+def commit_update(update_id, callback_id=None):
+    """Marks an update as fully handled; it reaches the disk within COMMIT_DELAY seconds."""
+    state = handoff.local()
+    state.last_update_id = max(state.last_update_id, update_id)
+    if callback_id:
+        state.recent_callbacks.append(callback_id)
+    state.commits += 1
+    if state.write_pending is None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return _flush(state)
+        state.write_pending = loop.call_later(COMMIT_DELAY, _flush, state)
+
+
+def _flush(state):
+    if state.write_pending is not None:
+        state.write_pending.cancel()
+        state.write_pending = None
+    try:
+        _write(state)
+    except Exception as e:
+        logging.error(f"❌ Failed to commit update {state.last_update_id}: {e}")
+
+
+def load_handoff(records=()):
+    """Restores the committed update id; records (the loaded queue) may carry newer ones."""
+    state = handoff.local()
+    saved = {}
+    if os.path.exists(state.path):
+        try:
+            with open(state.path, "r") as f:
+                saved = json.load(f)
+        except Exception as e:
+            logging.error(f"❌ Failed to read handoff state: {e}")
+    stamped = max((r.get("update_id") or 0 for r in records), default=0)
+    state.handoff_update_id = state.last_update_id = max(int(saved.get("last_update_id", 0)), stamped)
+    state.recent_callbacks.extend(saved.get("recent_callbacks", []))
+    if not state.last_update_id:
+        return
+    if "stopped_at" in saved:
+        since = f"previous process stopped {time.time() - saved['stopped_at']:.1f}s ago"
+    else:
+        since = "previous process did not shut down cleanly"
+    logging.info(f"🔁 Resuming after update {state.last_update_id} ({since}).")
+
+
+def _write(state, stopped=False):
+    entry = {"last_update_id": state.last_update_id, "recent_callbacks": list(state.recent_callbacks)}
+    if stopped:
+        entry["stopped_at"] = time.time()
+    tmp = state.path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp, state.path)
+
+
+def save_handoff():
+    state = handoff.local()
+    if state.write_pending is not None:
+        state.write_pending.cancel()
+        state.write_pending = None
+    try:
+        _write(state, stopped=True)
+        logging.info(f"💾 Handoff saved (last update {state.last_update_id}).")
+    except Exception as e:
+        logging.error(f"❌ Failed to save handoff state: {e}")
+
+
+def metrics():
+    state = handoff.local()
+    return {"last_update_id": state.last_update_id, "commits": state.commits, "skipped": state.skipped,
+            "resets": state.resets}
@@ -0,0 +1,153 @@
+
+# Logging setup: handlers only enqueue records, a listener thread writes them.
+#
+# setup_logging() puts a QueueHandler on the root logger, so the bot's event
+# loop and the dashboard threads never wait on console I/O. A QueueListener
+# formats records (JSON by default, LOG_FORMAT=text for the old plain lines),
+# redacts secrets and writes them to stdout. Per-logger levels come from
+# LOG_LEVELS ("httpx=WARNING,telegram=INFO") and chatty loggers can be sampled
+# with LOG_SAMPLE ("werkzeug=10" keeps one in ten records below WARNING).
+# A forked child (a gunicorn worker serving web.py) gets a fresh queue and its
+# own listener thread, since the parent's thread does not survive the fork.
+
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+import logging
+import atexit
+import queue
+import json
+import sys
+import re
+import os
+
+from config import BOT_TOKEN, QUEUE_PASSWORD, UMAMI_TOKEN, GOOGLE_CREDENTIALS
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_SAMPLE = os.environ.get("LOG_SAMPLE", "httpx=20,werkzeug=10")
+
+SECRET_PATTERNS = [
+    re.compile(r"\b\d{6,12}:[A-Za-z0-9_-]{30,}\b"),               # bot tokens
+    re.compile(r"(?i)(password=)[^&\s\"']+"),                   # dashboard URLs
+    re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+"),           # Authorization headers
+    re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----.*?-----END [A-Z ]*PRIVATE KEY-----", re.S),
+]
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+listener = None
+queue_handler = None
+console = None
+
+
+def parse_pairs(spec):
+    pairs = {}
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def redact(text):
+    for secret in (BOT_TOKEN, QUEUE_PASSWORD, UMAMI_TOKEN, GOOGLE_CREDENTIALS):
+        if secret and len(secret) >= 6:
+            text = text.replace(secret, "[REDACTED]")
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(lambda m: (m.group(1) if m.re.groups else "") + "[REDACTED]", text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        # Anything passed as extra={...} becomes a field of its own.
+        entry.update({k: v for k, v in vars(record).items() if k not in STANDARD_ATTRS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in every N records below WARNING for the configured loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        name = record.name
+        while name not in self.rates:
+            if "." not in name:
+                return True
+            name = name.rsplit(".", 1)[0]
+        # Counted per call site, so one noisy message does not starve the others.
+        key = (record.pathname, record.lineno)
+        n = self.counts.get(key, 0)
+        self.counts[key] = n + 1
+        return n % self.rates[name] == 0
+
+
+def setup_logging():
+    global queue_handler, console
+    if queue_handler:
+        return start_listener()
+    console = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "text":
+        console.setFormatter(TextFormatter("%(levelname)s:%(name)s:%(message)s"))
+    else:
+        console.setFormatter(JsonFormatter())
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    rates = {name: max(1, int(n)) for name, n in parse_pairs(LOG_SAMPLE).items() if n.isdigit()}
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    atexit.register(stop_logging)
+    os.register_at_fork(after_in_child=_after_fork)
+    return start_listener()
+
+
+def start_listener():
+    """Starts the writer thread, on a new queue, unless one is running."""
+    global listener
+    if listener is None:
+        queue_handler.queue = queue.SimpleQueue()
+        listener = QueueListener(queue_handler.queue, console)
+        listener.start()
+    return listener
+
+
+def _after_fork():
+    global listener
+    if queue_handler:
+        listener = None  # its thread stayed in the parent
+        start_listener()
+
+
+def stop_logging():
+    """Flushes queued records. Call before exiting or exec'ing a replacement process."""
+    global listener
+    if listener:
+        listener.stop()
+        listener = None
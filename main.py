@@ -1,145 +1,122 @@
 
 # Full version of BeruBot - includes everything (user flow, admin flow, moderation, dashboard)
 # Skipping comment headers for brevity
+#
+# Startup is split into phases (see bootstrap()). Only what the bot needs to
+# answer updates is loaded before polling starts; the dashboard, requests and
+# other optional pieces are imported afterwards. With TENANTS_FILE set, one
+# process polls several bots (see tenants.py and run_tenants()).
+
+import time
+
+_T0 = time.perf_counter()
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    filters, ContextTypes, CallbackQueryHandler
+    filters, ContextTypes, CallbackQueryHandler, TypeHandler, ApplicationHandlerStop
 )
-from telegram.ext import filters
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timedelta, UTC
-from flask import Flask, render_template_string, redirect, send_file, request
+from datetime import datetime, time as dtime
+from functools import lru_cache
 import threading
-import requests
 import logging
-import base64
-import os
-import json
 import asyncio
 import signal
 import sys
+import os
 
-logging.basicConfig(level=logging.INFO)
-
-request_queue = []
-MAX_REQUESTS = 50
-EDIT_TRACK_KEYWORD = "#behrupiyaedits"
-
-
-def handle_exit(*args):
-    logging.warning("🛑 Server shutting down. Saving queue...")
-    save_queue()
-    sys.exit(0)
-
-
-def load_queue():
-    global request_queue
-    if os.path.exists("queue.json"):
-        try:
-            with open("queue.json", "r") as f:
-                request_queue = json.load(f)
-                logging.info("✅ Queue loaded successfully from disk.")
-        except Exception as e:
-            logging.error(f"❌ Failed to load queue: {e}")
-
-load_queue()
-
-BOT_TOKEN = os.environ.get("BOT_TOKEN")
-ADMIN_ID = int(os.environ.get("ADMIN_ID"))
-GOOGLE_CREDENTIALS = os.environ.get("GOOGLE_CREDENTIALS")
-QUEUE_PASSWORD = os.environ.get("QUEUE_PASSWORD")
-UMAMI_URL = os.environ.get("UMAMI_URL")
-UMAMI_TOKEN = os.environ.get("UMAMI_TOKEN")
-UMAMI_SITE_ID = os.environ.get("UMAMI_SITE_ID")
-CREDS_FILE = "credentials.json"
-
-if GOOGLE_CREDENTIALS:
-    creds_json = base64.b64decode(GOOGLE_CREDENTIALS).decode('utf-8')
-    with open(CREDS_FILE, "w") as f:
-        f.write(creds_json)
-    with open(CREDS_FILE, "r") as f:
-        print("DEBUG CREDENTIALS:", f.read())
-        
-
-def save_queue():
-    try:
-        with open("queue.json", "w") as f:
-            json.dump(request_queue, f)
-        logging.info(f"💾 Queue saved ({len(request_queue)} items).")
-    except Exception as e:
-        logging.error(f"❌ Failed to save queue: {e}")
-
-def reset_queue():
-    global request_queue
-    request_queue.clear()
-    if os.path.exists("queue.json"):
-        os.remove("queue.json")
-
-from datetime import datetime, timezone
-
-def track_umami_event(event_name, data):
-    payload = {
-        "type": "event",
-        "payload": {
-            "hostname": "berubot.onrender.com",
-            "language": "en-US",
-            "referrer": "",
-            "screen": "unknown",
-            "title": event_name,
-            "url": "/",
-            "website": UMAMI_SITE_ID,
-            "name": event_name,
-            "data": {
-                **data,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-        }
-    }
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {UMAMI_TOKEN}",
-        "User-Agent": "berubot"
-    }
-
-    try:
-        res = requests.post(UMAMI_URL, json=payload, headers=headers, timeout=10)
-        print("UMAMI TRACK:", res.status_code, res.text)
-    except Exception as e:
-        print("UMAMI TRACK FAILED:", e)
+from config import (
+    ADMIN_ID, GOOGLE_CREDENTIALS, TELEGRAM_API_URL,
+    UPDATE_RECORD_FILE, PORT, EDIT_TRACK_KEYWORD, DASHBOARD_MODE, CONTROL_PORT
+)
+from store import request_queue, load_queue, save_queue, reset_queue, active_count
+from records import Record, Status, NO_CAPTION
+import records
+from capacity import capacity
+from media_cache import media_cache
+from thumbnails import thumbnailer
+from photo_index import photo_index
+from notifier import notifier
+from eta import estimator, pending_positions, describe as describe_eta
+from callbacks import router
+from search import search_index
+from moderation import moderator
+from joins import joins
+from backpressure import backpressure
+import bulk_actions
+import archive
+import analytics
+from analytics import track
+from http_client import http, telegram_request_settings
+from log_setup import setup_logging, stop_logging
+import lifecycle
+import tenants
+
+setup_logging()
+
+update_recorder = None
+sheets_log = None
+dashboard_server = None
+dashboard_stopped = False
+startup_timings = []
+_phase_mark = _T0
+
+
+pending_deletions = {}
+ARCHIVE_SWEEP_INTERVAL = 15 * 60
+CAPACITY_ROLL_INTERVAL = 5 * 60
+COMMIT_GROUP = 99
+
+
+def mark_phase(name):
+    global _phase_mark
+    now = time.perf_counter()
+    startup_timings.append((name, now - _phase_mark))
+    _phase_mark = now
+
+
+def startup_report(title):
+    parts = ", ".join(f"{name} {secs * 1000:.0f}ms" for name, secs in startup_timings)
+    logging.info(f"🚀 {title} after {(time.perf_counter() - _T0) * 1000:.0f}ms ({parts})")
+
+
+def log_to_sheet(request):
+    if sheets_log:
+        sheets_log.log(request)
 
 
 def is_admin(user_id):
-    return user_id == ADMIN_ID
+    return user_id in tenants.current().admin_ids
 
 def get_user_menu(user_id):
-    has_request = any(r["id"] == user_id for r in request_queue)
-    buttons = [[InlineKeyboardButton("Check Status", callback_data="check_status")]]
-    if has_request:
-        buttons.append([InlineKeyboardButton("Cancel Request", callback_data="cancel_request")])
-    else:
-        buttons.append([InlineKeyboardButton("Submit Request", callback_data="submit_request")])
-    return InlineKeyboardMarkup(buttons)
+    # Telegram objects are immutable, so the two possible menus are built once at startup.
+    # Done requests wait out the archive grace period in the queue but can no longer be cancelled.
+    has_request = any(r.id == user_id and r.status is Status.PENDING for r in request_queue)
+    return MENU_WITH_REQUEST if has_request else MENU_WITHOUT_REQUEST
+
+async def delete_later(bot, chat_id, message_id, delay):
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        # Also runs when cancelled, so a shutdown deletes pending messages right away.
+        pending_deletions.pop((chat_id, message_id), None)
+        try: await bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except: pass
 
 async def send_temp_message(bot, chat_id, text, **kwargs):
     try:
         msg = await bot.send_message(chat_id=chat_id, text=text, **kwargs)
-        await asyncio.sleep(5)
-        await bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
-    except: pass
-
-async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    for member in update.message.new_chat_members:
-        name = member.full_name
-        username = f"@{member.username}" if member.username else name
-        await send_temp_message(
-            context.bot, update.effective_chat.id,
-            f"👋 Welcome {username}!\n\n"
-            "📸 This group is for image editing requests only.\n"
-            "To request an edit, DM the bot."
-        )
+    except: return
+    # Deletion runs in the background instead of holding the handler for 5 seconds.
+    task = asyncio.create_task(delete_later(bot, chat_id, msg.message_id, 5))
+    pending_deletions[(chat_id, msg.message_id)] = task
+
+async def flush_temp_messages():
+    tasks = list(pending_deletions.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 
 async def moderate_group_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.chat.type == "private": return
@@ -152,70 +129,15 @@ async def moderate_group_messages(update: Update, context: ContextTypes.DEFAULT_
     #        pass
     #    return
    
-    user_id = update.message.from_user.id
-    chat = update.message.chat
-    member = await context.bot.get_chat_member(chat.id, user_id)
-    if member.status in ["administrator", "creator"]: return
-    try: await update.message.delete()
-    except: pass
-    await send_temp_message(
-        context.bot, chat.id,
-        "⚠️ Only admins can post here. Please DM the bot for any requests."
-    )
+    message = update.message
+    if await moderator.handle(context.bot, message) and (message.text or message.photo):
+        # The latest admin post is what gets reshared after welcomes.
+        joins.note_admin_post(message.chat.id, message.message_id)
 
 async def track_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print("🔍 track_membership triggered")
-    user = None
-    event_type = None
-
-    if update.message.new_chat_members:
-        for member in update.message.new_chat_members:
-            user = member
-            event_type = "joined"
-    elif update.message.left_chat_member:
-        user = update.message.left_chat_member
-        event_type = "left"
-
-    if user and event_type:
-        try:
-            payload = {
-                "type": "event",
-                "payload": {
-                    "hostname": "berubot.onrender.com",
-                    "language": "en-US",
-                    "referrer": "",
-                    "screen": "1920x1080",
-                    "title": "Telegram",
-                    "url": "/",
-                    "website": UMAMI_SITE_ID,
-                    "name": f"user_{event_type}",
-                    "data": {
-                        "username": user.username or user.full_name,
-                        "user_id": user.id,
-                        "timestamp": datetime.now(UTC).isoformat()
-                    }
-                }
-            }
-
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {UMAMI_TOKEN}",
-                "User-Agent": "berubot"
-            }
-
-            print("Sending to Umami:", json.dumps(payload, indent=2))
-            response = requests.post(UMAMI_URL, json=payload, headers=headers)
-            print("UMAMI Response:", response.status_code, response.text)
-
-        except Exception as e:
-            print("UMAMI USER TRACK FAILED:", e)
-        
-        if event_type == "left":
-            try:
-                await update.message.delete()
-                print("✅ Left message deleted")
-            except Exception as e:
-                print("❌ Failed to delete left message:", e)
+    if update.message.chat.type == "private": return
+    # Welcomes, analytics and service message cleanup happen once per window in joins.py.
+    joins.add(context.bot, update.message)
 
 
 # async def track_edit_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -277,13 +199,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=get_user_menu(uid)
     )
 
+async def reply_queue_full(update, uid):
+    hours = max(1, round(capacity.seconds_until_slot() / 3600))
+    await update.message.reply_text(
+        f"Queue full. Try again in about {hours} hour{'s' if hours != 1 else ''}.",
+        reply_markup=get_user_menu(uid)
+    )
+
 async def handle_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.chat.type != "private": return
     user = update.message.from_user
-    if len(request_queue) >= MAX_REQUESTS:
-        await update.message.reply_text("Queue full. Try again tomorrow.", reply_markup=get_user_menu(user.id))
+    if not capacity.remaining():
+        await reply_queue_full(update, user.id)
         return
-    if any(r["id"] == user.id for r in request_queue):
+    if any(r.id == user.id for r in request_queue):
         await update.message.reply_text("You already submitted a request.", reply_markup=get_user_menu(user.id))
         return
     if not update.message.photo:
@@ -292,67 +221,103 @@ async def handle_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not update.message.caption:
         await update.message.reply_text("📸 Got the image. Next time add a caption too.", reply_markup=get_user_menu(user.id))
-    req = {
-        "id": user.id, "name": user.username or user.first_name,
-        "status": "pending", "type": "photo",
-        "photo_id": update.message.photo[-1].file_id,
-        "caption": update.message.caption or "No caption",
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    req = Record(
+        id=user.id, name=user.username or user.first_name,
+        status=Status.PENDING, type="photo",
+        photo_id=update.message.photo[-1].file_id,
+        photo_uid=update.message.photo[-1].file_unique_id,
+        caption=update.message.caption or NO_CAPTION,
+        timestamp=records.now(),
+        update_id=update.update_id,  # see lifecycle.load_handoff
+    )
+    if not capacity.try_admit():
+        await reply_queue_full(update, user.id)
+        return
     request_queue.append(req)
     save_queue()
-    track_umami_event("image_edit_request", {
+    photo_index.expect(req.photo_uid, user.id, req.name)
+    cached = media_cache.get(req.photo_uid)
+    if cached:
+        photo_index.on_media(req.photo_uid, cached)
+    media_cache.schedule_prefetch(context.bot, req.photo_id, req.photo_uid)
+    log_to_sheet(req)
+    track("image_edit_request", {
     "user_id": user.id,
     "username": user.username or user.first_name,
-    "caption": update.message.caption or "No caption"
+    "caption": req.caption
     })
     await update.message.reply_text(
-        f"✅ Request received. You're #{len(request_queue)} in the queue.\n\n"
+        f"✅ Request received. You're #{active_count()} in the queue.\n\n"
         "⏱️ SLA: 24–48 hours\n"
         "⚡ Paid fast track available\n"
         "🔐 DM admin for private edits",
         reply_markup=get_user_menu(user.id)
     )
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def pending_text(r):
+    positions = pending_positions()
+    return (f"🕐 Still pending: #{positions.get(r.id, '?')} in line.\n"
+            f"⏱️ Expected around {describe_eta(r, positions)}.")
+
+
+@router.route("check_status")
+async def on_check_status(update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+    uid = update.callback_query.from_user.id
+    r = next((r for r in request_queue if r.id == uid), None)
+    msg = "❌ No request." if not r else (pending_text(r) if r.status is Status.PENDING else "✅ Completed!")
+    await update.callback_query.edit_message_text(msg, reply_markup=get_user_menu(uid))
+
+
+@router.route("cancel_request")
+async def on_cancel_request(update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
     query = update.callback_query
-    await query.answer()
     uid = query.from_user.id
-    data = query.data
-    if data == "check_status":
-        r = next((r for r in request_queue if r["id"] == uid), None)
-        msg = "❌ No request." if not r else ("🕐 Pending..." if r["status"] == "pending" else "✅ Completed!")
-        await query.edit_message_text(msg, reply_markup=get_user_menu(uid))
-    elif data == "cancel_request":
-        i = next((i for i, r in enumerate(request_queue) if r["id"] == uid), None)
-        if i is not None:
-            request_queue[i]["status"] = "cancelled"
-            del request_queue[i]
-            save_queue()
-            await query.edit_message_text("❌ Cancelled.", reply_markup=get_user_menu(uid))
-        else:
-            await query.edit_message_text("No request found.", reply_markup=get_user_menu(uid))
-    elif data == "submit_request":
-        await query.edit_message_text("Send a photo + caption to get started.", reply_markup=get_user_menu(uid))
-    elif data.startswith("admin_done:"):
-        tid = int(data.split(":")[1])
-        for r in request_queue:
-            if r["id"] == tid:
-                r["status"] = "done"
-                save_queue()
-                try: await context.bot.send_message(chat_id=tid, text="✅ Your request is completed.")
-                except: pass
-                await query.edit_message_text(f"{r['name']}'s request marked done.")
-                return
-        await query.edit_message_text("Request not found.")
+    cancelled = next(iter(bulk_actions.select_pending(ids=[uid], count=1)), None)
+    if cancelled is not None:
+        cancelled.status = Status.CANCELLED
+        request_queue.remove(cancelled)
+        save_queue()
+        archive.archive_cancelled(cancelled)
+        log_to_sheet(cancelled)
+        await query.edit_message_text("❌ Cancelled.", reply_markup=get_user_menu(uid))
+    else:
+        await query.edit_message_text("No request found.", reply_markup=get_user_menu(uid))
+
+
+@router.route("submit_request")
+async def on_submit_request(update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+    uid = update.callback_query.from_user.id
+    await update.callback_query.edit_message_text("Send a photo + caption to get started.", reply_markup=get_user_menu(uid))
+
+
+@router.route("admin_done", parse=int, admin_only=True)
+async def on_admin_done(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
+    done = bulk_actions.complete(ids=[user_id])
+    await update.callback_query.edit_message_text(f"{done[0].name}'s request marked done." if done else "Request not found.")
+
+
+router.is_admin = is_admin
+MENU_WITH_REQUEST = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Check Status", callback_data=router.data("check_status"))],
+    [InlineKeyboardButton("Cancel Request", callback_data=router.data("cancel_request"))],
+])
+MENU_WITHOUT_REQUEST = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Check Status", callback_data=router.data("check_status"))],
+    [InlineKeyboardButton("Submit Request", callback_data=router.data("submit_request"))],
+])
+
+
+@lru_cache(maxsize=256)
+def done_button(user_id):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Mark as Done", callback_data=router.data("admin_done", user_id))]])
 
 async def check_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.message.from_user.id
-    r = next((r for r in request_queue if r["id"] == uid), None)
+    r = next((r for r in request_queue if r.id == uid), None)
     if not r:
         await update.message.reply_text("❌ No request in queue.", reply_markup=get_user_menu(uid))
-    elif r["status"] == "pending":
-        await update.message.reply_text("🕐 Still pending.", reply_markup=get_user_menu(uid))
+    elif r.status is Status.PENDING:
+        await update.message.reply_text(pending_text(r), reply_markup=get_user_menu(uid))
     else:
         await update.message.reply_text("✅ Completed!", reply_markup=get_user_menu(uid))
 
@@ -364,271 +329,322 @@ async def show_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Queue is empty.")
         return
     for i, r in enumerate(request_queue, 1):
-        btn = InlineKeyboardMarkup([[InlineKeyboardButton("Mark as Done", callback_data=f"admin_done:{r['id']}")]])
-        await update.message.reply_text(f"{i}. {r['name']} - {r['type']} - {r['status']}", reply_markup=btn)
+        btn = done_button(r.id)
+        text = f"{i}. {r.name} - {r.type} - {r.status}"
+        for m in photo_index.duplicates(r.photo_uid):
+            text += f"\n⚠️ Looks like {m['name']}'s photo (distance {m['distance']})"
+        await update.message.reply_text(text, reply_markup=btn)
+
+def parse_ids(args):
+    try:
+        return [int(a) for a in args]
+    except ValueError:
+        return None
+
+
+async def bulk_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("Not authorized.")
+        return
+    args = context.args
+    if args == ["all"]:
+        done = bulk_actions.complete()
+    elif len(args) == 1 and args[0].isdigit():
+        done = bulk_actions.complete(count=int(args[0]))
+    elif len(args) > 1 and args[0] == "id" and parse_ids(args[1:]):
+        done = bulk_actions.complete(ids=parse_ids(args[1:]))
+    else:
+        await update.message.reply_text("Usage: /done all | /done <count> | /done id <user_id> ...")
+        return
+    await update.message.reply_text(f"✅ {len(done)} requests marked done. "
+                                    f"{notifier.pending()} notifications queued.")
+
+
+async def bulk_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("Not authorized.")
+        return
+    ids = parse_ids(context.args)
+    if not ids:
+        await update.message.reply_text("Usage: /drop <user_id> ...")
+        return
+    cancelled = bulk_actions.cancel(ids)
+    await update.message.reply_text(f"❌ {len(cancelled)} requests cancelled.")
+
+
+async def notify_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("Not authorized.")
+        return
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("Usage: /notify <message>")
+        return
+    sent = bulk_actions.message_pending(text)
+    await update.message.reply_text(f"📨 Message queued for {sent} pending users.")
+
 
 async def manual_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_admin(update.message.from_user.id):
         reset_queue()
+        capacity.reset()
         await update.message.reply_text("Queue reset.")
     else:
         await update.message.reply_text("Not authorized.")
 
-flask_app = Flask(__name__)
-TEMPLATE = """<!doctype html><title>Queue</title><h2>Queue ({{ queue|length }}/{{ max_requests }})</h2><ul>
-{% for r in queue %}
-<li><b>{{ r.name }}</b> - {{ r.type }} - <i>{{ r.status }}</i><br>
-{% if r.type == 'photo' %}
-<a href="https://api.telegram.org/file/bot{{ bot_token }}/{{ r.file_path }}" target="_blank">Download</a><br>
-<i>{{ r.caption }}</i>
-{% endif %}</li><hr>
-{% endfor %}</ul>
-"""
-
-
-USER_TEMPLATE = """
-<!doctype html>
-<title>Queue Status</title>
-<h2>Current Queue ({{ queue|length }})</h2>
-<table border="1" cellspacing="0" cellpadding="5">
-    <tr>
-        <th>#</th>
-        <th>User</th>
-        <th>Status</th>
-        <th>Expected Delivery</th>
-    </tr>
-    {% for r in queue %}
-    <tr>
-        <td>{{ loop.index }}</td>
-        <td>{{ r.name }}</td>
-        <td>{{ r.status }}</td>
-        <td>{{ r.expected }}</td>
-    </tr>
-    {% endfor %}
-</table>
-"""
-
-LANDING_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-  <meta charset="UTF-8">
-  <title>BeruBot – Behrupiya Edits</title>
-  <style>
-    body {
-      background-color: #000;
-      color: #fff;
-      font-family: 'Courier New', Courier, monospace;
-      padding: 40px;
-      text-align: center;
-    }
-    h1 {
-      font-size: 2.5em;
-      margin-bottom: 10px;
-    }
-    p {
-      font-size: 1.1em;
-      margin: 10px auto;
-      max-width: 600px;
-    }
-    ul {
-      list-style: none;
-      padding: 0;
-      margin: 20px 0;
-    }
-    ul li {
-      background: #111;
-      margin: 10px auto;
-      padding: 10px 20px;
-      border: 1px solid #333;
-      max-width: 400px;
-      border-radius: 6px;
-    }
-    a {
-      color: #fff;
-      background: #333;
-      padding: 10px 20px;
-      text-decoration: none;
-      border-radius: 6px;
-      display: inline-block;
-      margin: 10px;
-      transition: background 0.3s ease;
-    }
-    a:hover {
-      background: #fff;
-      color: #000;
-    }
-    hr {
-      margin: 30px auto;
-      width: 60%;
-      border: 1px solid #444;
-    }
-  </style>
-</head>
-<body>
-  <h1>Welcome to Behrupiya Edits 💀</h1>
-  <p>BeruBot is your NSFW fantasy image editing genie.</p>
-  <ul>
-    <li>💥 Realistic edits of your wildest dreams</li>
-    <li>🔞 NSFW with a purpose — Respect in Real Life</li>
-    <li>⏱️ Free queue: 24–48hr SLA</li>
-    <li>⚡ Fast delivery: Paid options available</li>
-  </ul>
-  <a href="https://t.me/behrupiya_bot" target="_blank">👉 Chat with BeruBot on Telegram</a>
-  <hr>
-  <a href="/status">View Public Queue</a>
-</body>
-</html>
-"""
-
-
-@flask_app.route("/")
-def landing_page():
-    return render_template_string(LANDING_TEMPLATE)
-
-
-# @flask_app.route("/adminbeh")
-# def admin_queue():
-#     display = []
-#     for r in request_queue:
-#         item = r.copy()
-#         if r["type"] == "photo":
-#             try:
-#                 f = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={r['photo_id']}").json()
-#                 item["file_path"] = f["result"]["file_path"]
-#             except:
-#                 item["file_path"] = ""
-#         display.append(item)
-#     return render_template_string(TEMPLATE, queue=display, bot_token=BOT_TOKEN, max_requests=MAX_REQUESTS)
-
-
-@flask_app.route("/adminbeh")
-def admin_queue():
-    pwd = request.args.get("password")
-    if pwd != QUEUE_PASSWORD:
-        return "Unauthorized. Invalid password.", 401
-
-    display = []
-    for r in request_queue:
-        item = r.copy()
-        if r["type"] == "photo":
-            try:
-                f = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={r['photo_id']}").json()
-                item["file_path"] = f["result"]["file_path"]
-            except:
-                item["file_path"] = ""
-        display.append(item)
-
-    return render_template_string(TEMPLATE, queue=display, bot_token=BOT_TOKEN, max_requests=MAX_REQUESTS)
-
-
-
-# @flask_app.route("/")
-# def index():
-#     display = []
-#     for r in request_queue:
-#         item = r.copy()
-#         if r["type"] == "photo":
-#             try:
-#                 f = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={r['photo_id']}").json()
-#                 item["file_path"] = f["result"]["file_path"]
-#             except: item["file_path"] = ""
-#         display.append(item)
-#     return render_template_string(TEMPLATE, queue=display, bot_token=BOT_TOKEN, max_requests=MAX_REQUESTS)
-
-# @flask_app.route("/reset", methods=["GET", "POST"])
-# def reset(): reset_queue(); return redirect("/")
-
-@flask_app.route("/reset", methods=["GET", "POST"])
-def reset():
-    pwd = request.args.get("password")
-    if pwd != QUEUE_PASSWORD:
-        logging.warning(f"❌ Unauthorized queue reset attempt! IP: {request.remote_addr}")
-        return "Unauthorized", 401
-
-    logging.warning(f"⚠️ Queue reset triggered! IP: {request.remote_addr}")
-    track_umami_event("queue_reset", {
-        "by": "web",
-        "ip": request.remote_addr
-    })
-    
-    reset_queue()
-    return redirect("/")
-
-@flask_app.route("/download-queue")
-def download_queue():
-    pwd = request.args.get("password")
-    if pwd != QUEUE_PASSWORD:
-        return "Unauthorized. Invalid password.", 401
-
-    if os.path.exists("queue.json"):
-        return send_file("queue.json", as_attachment=True)
-    return "No queue file found.", 404
-
-
-@flask_app.route("/restore-queue", methods=["POST"])
-def restore_queue():
-    pwd = request.args.get("password")
-    if pwd != QUEUE_PASSWORD:
-        return "Unauthorized", 401
-
-    data = request.get_json()
-    if not isinstance(data, list):
-        return "Invalid format", 400
-
-    with open("queue.json", "w") as f:
-        json.dump(data, f)
-
-    return "Queue restored", 200
-
-
-@flask_app.route("/status")
-def public_status():
-    display = []
-    for r in request_queue:
-        item = {
-            "name": r["name"],
-            "status": r["status"]
-        }
-        try:
-            # Extract timestamp from each request (add it when appending to queue)
-            timestamp = r.get("timestamp")
-            if timestamp:
-                dt = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
-                item["expected"] = (dt + timedelta(hours=48)).strftime("%b %d, %I:%M %p")
-            else:
-                item["expected"] = "Unknown"
-        except:
-            item["expected"] = "Unknown"
-        display.append(item)
-    return render_template_string(USER_TEMPLATE, queue=display)
+async def sweep_archive(context: ContextTypes.DEFAULT_TYPE):
+    archive.sweep()
 
 
+async def roll_capacity(context: ContextTypes.DEFAULT_TYPE):
+    if capacity.roll():
+        capacity.save()
+        logging.info(f"📥 Capacity window rolled over: {capacity.remaining()}/{capacity.limit} slots open.")
 
-if __name__ == "__main__":
-    signal.signal(signal.SIGINT, handle_exit)
-    signal.signal(signal.SIGTERM, handle_exit)
-    port = int(os.environ.get("PORT", 8080))
-    threading.Thread(target=lambda: flask_app.run(host="0.0.0.0", port=port)).start()
-    
-    # uncomment this line for reseting queue daily
-    # scheduler = BackgroundScheduler()
-    # scheduler.add_job(reset_queue, 'cron', hour=0, minute=0)
-    # scheduler.start()
+
+def callback_id(update):
+    return update.callback_query.id if update.callback_query else None
+
+
+async def skip_handled_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not lifecycle.note_update(update.update_id, callback_id(update)):
+        logging.info(f"⏭️ Skipping update {update.update_id}, already handled.")
+        raise ApplicationHandlerStop
+
+
+async def commit_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Last group: runs once every other handler for this update has finished.
+    lifecycle.commit_update(update.update_id, callback_id(update))
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update_recorder:
+        update_recorder.record(update.to_dict())
+
+
+def start_services():
+    # Process-wide helpers, shared by every tenant's bot.
+    global update_recorder, sheets_log
+    if UPDATE_RECORD_FILE:
+        from replay import UpdateRecorder
+        update_recorder = UpdateRecorder(UPDATE_RECORD_FILE, admin_id=ADMIN_ID)
+    if GOOGLE_CREDENTIALS:
+        from sheets_log import SheetsLog
+        sheets_log = SheetsLog()
+        lifecycle.register_drain("sheets log", sheets_log.close)
+
+
+def build_application(token=None):
     moderation_filter = filters.ALL & (~filters.StatusUpdate.NEW_CHAT_MEMBERS) & (~filters.StatusUpdate.LEFT_CHAT_MEMBER) & (~filters.Caption(EDIT_TRACK_KEYWORD))
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # Moderation and join state is per bot (see tenants.py).
+    moderator.send_warning = send_temp_message
+    joins.send_welcome = send_temp_message
+    tg = telegram_request_settings()
+    app = (
+        ApplicationBuilder().token(token or tenants.current().bot_token).base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .connection_pool_size(tg["connection_pool_size"]).pool_timeout(tg["pool_timeout"])
+        .connect_timeout(tg["connect_timeout"]).read_timeout(tg["read_timeout"]).write_timeout(tg["write_timeout"])
+        .post_init(post_init).post_stop(post_stop).build()
+    )
+    app.add_handler(TypeHandler(Update, skip_handled_updates), group=-2)
+    # Periodic work runs on the bot's own event loop, never on a separate thread.
+    app.job_queue.run_repeating(sweep_archive, interval=ARCHIVE_SWEEP_INTERVAL, first=60)
+    if capacity.mode == "calendar":
+        reset_at = dtime(hour=capacity.reset_hour, tzinfo=datetime.now().astimezone().tzinfo)
+        app.job_queue.run_daily(roll_capacity, time=reset_at)
+    else:
+        app.job_queue.run_repeating(roll_capacity, interval=CAPACITY_ROLL_INTERVAL, first=CAPACITY_ROLL_INTERVAL)
+    if update_recorder:
+        app.add_handler(TypeHandler(Update, record_update), group=-1)
+    app.add_handler(TypeHandler(Update, commit_update), group=COMMIT_GROUP)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("status", check_status))
     app.add_handler(CommandHandler("queue", show_queue))
     app.add_handler(CommandHandler("reset", manual_reset))
+    app.add_handler(CommandHandler("done", bulk_done))
+    app.add_handler(CommandHandler("drop", bulk_cancel))
+    app.add_handler(CommandHandler("notify", notify_pending))
     app.add_handler(MessageHandler(filters.TEXT | filters.PHOTO, handle_request))
-    app.add_handler(CallbackQueryHandler(handle_callback))
-    app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, welcome_new_member))
+    app.add_handler(CallbackQueryHandler(router.dispatch))
 
     app.add_handler(MessageHandler(moderation_filter, moderate_group_messages), group=True)
     app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS | filters.StatusUpdate.LEFT_CHAT_MEMBER, track_membership), group=True)    
     # app.add_handler(MessageHandler(filters.Caption(EDIT_TRACK_KEYWORD), track_edit_posts), group=True)
+    return app
+
+
+def start_dashboard():
+    from werkzeug.serving import make_server
+    from dashboard import flask_app
+    http.session()  # warm up requests before the first dashboard call needs it
+    if DASHBOARD_MODE == "external":
+        # web.py serves the public site; only forwarded admin actions reach the bot.
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        # Only web.py can connect here, so its X-Forwarded-For is trusted for the client IP.
+        server = make_server("127.0.0.1", CONTROL_PORT, ProxyFix(flask_app), threaded=True)
+    else:
+        server = make_server("0.0.0.0", PORT, flask_app, threaded=True)
+    global dashboard_server
+    if dashboard_stopped:
+        return
+    dashboard_server = server
+    mark_phase("dashboard")
+    startup_report("Control endpoint up" if DASHBOARD_MODE == "external" else "Dashboard up")
+    server.serve_forever()
+
+
+async def stop_dashboard():
+    # First drain step: no admin action may change the queue or notify users
+    # once the notifier and the rest have been drained.
+    global dashboard_stopped
+    dashboard_stopped = True
+    if dashboard_server:
+        await asyncio.to_thread(dashboard_server.shutdown)
+
+
+def start_deferred_services():
+    backpressure.start()
+    if sheets_log:
+        sheets_log.start()
+    threading.Thread(target=start_dashboard, name="dashboard", daemon=True).start()
+
 
+async def start_deferred_tenant(app):
+    # Runs in the tenant's context; to_thread carries it into the worker thread.
+    notifier.start(app.bot)
+    await asyncio.to_thread(photo_index.load)
+    await asyncio.to_thread(estimator.load)
+    await asyncio.to_thread(search_index.warm)
 
-    app.run_polling()
+
+async def start_deferred(app):
+    # Nothing in here is needed to answer updates, so it waits until polling runs.
+    while not app.running:
+        await asyncio.sleep(0.05)
+    mark_phase("start_polling")
+    startup_report("Bot ready")
+    start_deferred_services()
+    await start_deferred_tenant(app)
+
+
+def request_restart(stop):
+    logging.warning("🔄 Restart requested.")
+    lifecycle.restart_requested = True
+    stop()
+
+
+async def post_init(app):
+    mark_phase("initialize")
+    loop = asyncio.get_running_loop()
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(signal.SIGHUP, request_restart, app.stop_running)
+    # Starting the forkserver blocks; do it here, not in the first handler that needs it.
+    await asyncio.to_thread(thumbnailer.start)
+    loop.create_task(start_deferred(app))
+
+
+def save_tenant_state():
+    save_queue()
+    lifecycle.save_handoff()
+
+
+async def finish():
+    # By now polling has stopped (fetched updates are acknowledged to Telegram)
+    # and every queued update has been handled.
+    logging.warning("🛑 Server shutting down. Draining and saving queue...")
+    await lifecycle.drain()
+    await tenants.each(save_tenant_state)
+    if update_recorder:
+        update_recorder.close()
+
+
+async def post_stop(app):
+    await finish()
+
+
+# Dashboard intake stops first. Moderation and joins post temp messages while
+# draining, so they go before the temp messages and the notifier.
+lifecycle.register_drain("dashboard", stop_dashboard)
+lifecycle.register_drain("load sampler", backpressure.stop)
+lifecycle.register_drain("moderation", lambda: tenants.each(lambda: moderator.drain()))
+lifecycle.register_drain("joins", lambda: tenants.each(lambda: joins.drain()))
+lifecycle.register_drain("temp messages", flush_temp_messages)
+lifecycle.register_drain("notifications", lambda: tenants.each(lambda: notifier.close()))
+lifecycle.register_drain("media prefetch", media_cache.drain)
+lifecycle.register_drain("thumbnails", thumbnailer.drain)
+lifecycle.register_drain("analytics", analytics.drain)
+lifecycle.register_drain("http client", http.aclose)
+# Per-tenant objects are looked up when called, so these go through the proxies.
+media_cache.listeners.append(thumbnailer.submit)
+media_cache.listeners.append(lambda uid, path: photo_index.on_media(uid, path))
+bulk_actions.listeners.append(log_to_sheet)
+bulk_actions.listeners.append(lambda record: estimator.on_change(record))
+
+
+def load_tenant_state():
+    load_queue()
+    capacity.load()
+    lifecycle.load_handoff(request_queue)
+
+
+def bootstrap():
+    mark_phase("imports")
+    for tenant in tenants.tenants:
+        with tenant.active():
+            load_tenant_state()
+    mark_phase("load_queue")
+    start_services()
+    apps = []
+    for tenant in tenants.tenants:
+        with tenant.active():
+            apps.append(build_application())
+            backpressure.watch(apps[-1].update_queue)
+    mark_phase("build_application")
+    return apps
+
+
+async def run_tenants(apps):
+    """Polls every tenant's bot on one event loop until SIGINT/SIGTERM (or SIGHUP to restart)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(signal.SIGHUP, request_restart, stop.set)
+
+    # Everything an app starts (fetcher, polling, jobs, handler tasks) inherits
+    # the context it was started in, and with it the tenant.
+    for tenant, app in zip(tenants.tenants, apps):
+        with tenant.active():
+            await app.initialize()
+            await app.start()
+            await app.updater.start_polling()
+    mark_phase("start_polling")
+    startup_report(f"{len(apps)} bots ready")
+    start_deferred_services()
+    for tenant, app in zip(tenants.tenants, apps):
+        with tenant.active():
+            loop.create_task(start_deferred_tenant(app))
+
+    await stop.wait()
+    for app in apps:
+        await app.updater.stop()
+    for app in apps:
+        await app.stop()
+    await finish()
+    for app in apps:
+        await app.shutdown()
+
+
+if __name__ == "__main__":
+    apps = bootstrap()
+    if tenants.multi:
+        asyncio.run(run_tenants(apps))
+    else:
+        # SIGINT/SIGTERM are handled by run_polling, which ends in post_stop above.
+        apps[0].run_polling()
+    if lifecycle.restart_requested:
+        stop_logging()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
@@ -0,0 +1,161 @@
+
+# Local cache of submitted photos, keyed by Telegram's file_unique_id.
+#
+# handle_request schedules a background download as soon as a photo is
+# accepted, so the admin dashboard reads images from local disk instead of
+# linking to api.telegram.org with the bot token in the URL. A photo submitted
+# twice has the same file_unique_id and is stored once. The cache is bounded by
+# size and evicts least recently used files; file mtimes double as the LRU
+# order, so it survives restarts without a separate index. file_unique_id is
+# the same for every bot, so all tenants share one cache.
+
+from collections import OrderedDict
+import threading
+import logging
+import asyncio
+import re
+import os
+
+from config import TELEGRAM_API_URL
+from tenants import current
+from http_client import http, HTTP_CONNECT_TIMEOUT
+
+MEDIA_DIR = os.environ.get("MEDIA_CACHE_DIR", "media")
+MAX_BYTES = int(float(os.environ.get("MEDIA_CACHE_MAX_MB", 500)) * 1024 * 1024)
+VALID_KEY = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+class MediaCache:
+    def __init__(self, directory=MEDIA_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # file_unique_id -> size, least recently used first
+        self.total = 0
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.pending = {}  # file_unique_id -> prefetch task; like entries, only changed under self.lock
+        self.listeners = []  # called as fn(uid, path) whenever a file is added
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_loaded(self):
+        # Called with self.lock held.
+        if self.loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and VALID_KEY.match(entry.name):
+                st = entry.stat()
+                files.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total += size
+        self.loaded = True
+
+    def path(self, uid):
+        return os.path.join(self.directory, uid)
+
+    def get(self, uid):
+        """Returns the cached file path for uid, or None."""
+        if not VALID_KEY.match(uid or ""):
+            return None
+        with self.lock:
+            self._ensure_loaded()
+            if uid not in self.entries:
+                # Another process (the bot, when web.py serves the dashboard) may have stored it since.
+                try:
+                    self.entries[uid] = os.path.getsize(self.path(uid))
+                    self.total += self.entries[uid]
+                except OSError:
+                    self.misses += 1
+                    return None
+            self.entries.move_to_end(uid)
+            self.hits += 1
+        path = self.path(uid)
+        try:
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.total -= self.entries.pop(uid, 0)
+            return None
+        return path
+
+    def put(self, uid, tmp_path):
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            self._ensure_loaded()
+            os.replace(tmp_path, self.path(uid))
+            self.total += size - self.entries.pop(uid, 0)
+            self.entries[uid] = size
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                old, old_size = self.entries.popitem(last=False)
+                self.total -= old_size
+                try:
+                    os.remove(self.path(old))
+                except OSError:
+                    pass
+        for listener in self.listeners:
+            listener(uid, self.path(uid))
+
+    def tmp_path(self, uid):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f".{uid}.{threading.get_ident()}.part")
+
+    def schedule_prefetch(self, bot, file_id, uid):
+        """Starts a background download on the running event loop; never blocks the handler."""
+        if not VALID_KEY.match(uid or ""):
+            return
+        with self.lock:
+            self._ensure_loaded()
+            if uid in self.entries or uid in self.pending:
+                return
+            task = asyncio.create_task(self._download(bot, file_id, uid))
+            self.pending[uid] = task
+        task.add_done_callback(lambda t: self._finished(uid))
+
+    def _finished(self, uid):
+        with self.lock:
+            self.pending.pop(uid, None)
+
+    async def _download(self, bot, file_id, uid):
+        tmp = self.tmp_path(uid)
+        try:
+            f = await bot.get_file(file_id)
+            await f.download_to_drive(tmp)
+            self.put(uid, tmp)
+        except Exception as e:
+            logging.warning(f"🖼️ Prefetch of {uid} failed: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def fetch_sync(self, file_id):
+        """Downloads file_id into the cache from a non-async thread. Returns its file_unique_id."""
+        token = current().bot_token  # file_ids only work with the bot that received them
+        info = http.request("GET", f"{TELEGRAM_API_URL}/bot{token}/getFile",
+                            params={"file_id": file_id}).json()["result"]
+        uid = info["file_unique_id"]
+        if self.get(uid):
+            return uid
+        tmp = self.tmp_path(uid)
+        try:
+            with http.request("GET", f"{TELEGRAM_API_URL}/file/bot{token}/{info['file_path']}",
+                              stream=True, timeout=(HTTP_CONNECT_TIMEOUT, 30)) as res:
+                res.raise_for_status()
+                with open(tmp, "wb") as out:
+                    for chunk in res.iter_content(64 * 1024):
+                        out.write(chunk)
+            self.put(uid, tmp)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return uid
+
+    async def drain(self):
+        with self.lock:
+            tasks = list(self.pending.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+media_cache = MediaCache()
@@ -0,0 +1,164 @@
+
+# Group moderation that holds up under spam raids.
+#
+# Messages from non-admins are not deleted one by one: their ids are collected
+# per chat and removed with one deleteMessages call per MOD_FLUSH_DELAY window
+# (up to 100 ids each). At most one "only admins can post" warning goes out
+# per chat every MOD_WARN_INTERVAL seconds. If more than RAID_THRESHOLD
+# messages arrive within RAID_WINDOW seconds, the chat enters raid mode: the
+# default member permissions are switched off for RAID_DURATION seconds (then
+# restored) and a single notice is posted. Admin lists are cached per chat
+# instead of calling getChatMember for every message, so outbound calls
+# grow with the number of windows rather than the number of spam messages.
+# At the highest load level (backpressure.py) expired admin lists are used
+# as they are and no warnings are posted; deletion and raid mode carry on.
+
+from collections import deque
+import logging
+import asyncio
+import time
+import os
+
+from telegram import ChatPermissions
+
+from backpressure import backpressure, MODERATION
+from tenants import TenantLocal
+
+FLUSH_DELAY = float(os.environ.get("MOD_FLUSH_DELAY", 1))
+WARN_INTERVAL = float(os.environ.get("MOD_WARN_INTERVAL", 60))
+RAID_WINDOW = float(os.environ.get("RAID_WINDOW", 10))
+RAID_THRESHOLD = int(os.environ.get("RAID_THRESHOLD", 20))
+RAID_DURATION = float(os.environ.get("RAID_DURATION", 600))
+ADMIN_CACHE_TTL = 600
+DELETE_BATCH = 100  # deleteMessages limit
+
+WARNING_TEXT = "⚠️ Only admins can post here. Please DM the bot for any requests."
+RAID_TEXT = "🛡️ Too many messages at once. The group is locked for a few minutes."
+LOCKED = ChatPermissions.no_permissions()
+
+
+class ChatState:
+    __slots__ = ("to_delete", "flush_task", "last_warning", "recent", "raid_until", "saved_permissions", "lift_task")
+
+    def __init__(self):
+        self.to_delete = []
+        self.flush_task = None
+        self.last_warning = 0
+        self.recent = deque()  # arrival times of offending messages within RAID_WINDOW
+        self.raid_until = 0
+        self.saved_permissions = None
+        self.lift_task = None
+
+
+class Moderator:
+    def __init__(self, send_warning=None):
+        self.send_warning = send_warning  # async fn(bot, chat_id, text); main sets send_temp_message
+        self.chats = {}
+        self.admins = {}  # chat_id -> (expires_at, set of admin user ids)
+        self.stats = {"offending": 0, "deleted": 0, "delete_calls": 0, "warnings": 0, "raids": 0}
+
+    async def is_admin(self, bot, chat_id, user_id):
+        now = time.monotonic()
+        cached = self.admins.get(chat_id)
+        if cached is None or (cached[0] < now and not backpressure.shedding(MODERATION)):
+            members = await bot.get_chat_administrators(chat_id)
+            cached = (now + ADMIN_CACHE_TTL, {m.user.id for m in members})
+            self.admins[chat_id] = cached
+        return user_id in cached[1]
+
+    async def handle(self, bot, message):
+        """Moderates one group message. Returns True if it came from an admin."""
+        chat_id = message.chat.id
+        # Anonymous admins post as the group itself.
+        if message.sender_chat and message.sender_chat.id == chat_id:
+            return True
+        try:
+            if await self.is_admin(bot, chat_id, message.from_user.id):
+                return True
+        except Exception as e:
+            # Without a reliable admin list, leave the message alone rather than risk deleting an admin's post.
+            logging.warning(f"🛡️ Could not load admins of {chat_id}: {e}")
+            return
+
+        self.stats["offending"] += 1
+        state = self.chats.setdefault(chat_id, ChatState())
+        now = time.monotonic()
+        state.to_delete.append(message.message_id)
+        if state.flush_task is None:
+            state.flush_task = asyncio.create_task(self.flush_later(bot, chat_id, state))
+
+        state.recent.append(now)
+        while state.recent and state.recent[0] <= now - RAID_WINDOW:
+            state.recent.popleft()
+        if now < state.raid_until:
+            return
+        if len(state.recent) >= RAID_THRESHOLD:
+            await self.start_raid(bot, chat_id, state, now)
+        elif now - state.last_warning >= WARN_INTERVAL and not backpressure.shedding(MODERATION):
+            state.last_warning = now
+            self.stats["warnings"] += 1
+            await self.send_warning(bot, chat_id, WARNING_TEXT)
+
+    async def flush_later(self, bot, chat_id, state):
+        try:
+            await asyncio.sleep(FLUSH_DELAY)
+        finally:
+            # Also runs when cancelled at shutdown, so queued spam is still removed.
+            state.flush_task = None
+            await self.flush(bot, chat_id, state)
+
+    async def flush(self, bot, chat_id, state):
+        ids, state.to_delete = state.to_delete, []
+        for i in range(0, len(ids), DELETE_BATCH):
+            batch = ids[i:i + DELETE_BATCH]
+            self.stats["delete_calls"] += 1
+            try:
+                await bot.delete_messages(chat_id, batch)
+                self.stats["deleted"] += len(batch)
+            except Exception as e:
+                logging.warning(f"🛡️ Bulk delete of {len(batch)} messages in {chat_id} failed: {e}")
+
+    async def start_raid(self, bot, chat_id, state, now):
+        state.raid_until = now + RAID_DURATION
+        self.stats["raids"] += 1
+        logging.warning(f"🛡️ Raid detected in {chat_id}: {len(state.recent)} messages "
+                        f"in {RAID_WINDOW:.0f}s. Locking for {RAID_DURATION:.0f}s.")
+        try:
+            chat = await bot.get_chat(chat_id)
+            state.saved_permissions = chat.permissions
+            await bot.set_chat_permissions(chat_id, LOCKED)
+        except Exception as e:
+            logging.warning(f"🛡️ Could not restrict {chat_id}: {e}")
+        await self.send_warning(bot, chat_id, RAID_TEXT)
+        state.lift_task = asyncio.create_task(self.lift_later(bot, chat_id, state))
+
+    async def lift_later(self, bot, chat_id, state):
+        try:
+            await asyncio.sleep(RAID_DURATION)
+        finally:
+            # Also runs when cancelled at shutdown, so a restart never leaves the group locked.
+            state.lift_task = None
+            await self.lift(bot, chat_id, state)
+
+    async def lift(self, bot, chat_id, state):
+        state.raid_until = 0
+        state.recent.clear()
+        if state.saved_permissions is None:
+            return
+        permissions, state.saved_permissions = state.saved_permissions, None
+        try:
+            await bot.set_chat_permissions(chat_id, permissions)
+            logging.info(f"🛡️ Raid mode lifted in {chat_id}.")
+        except Exception as e:
+            logging.error(f"❌ Could not restore permissions in {chat_id}: {e}")
+
+    async def drain(self):
+        tasks = [t for s in self.chats.values() for t in (s.flush_task, s.lift_task) if t]
+        # A task cancelled before it first runs would skip its finally block.
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+moderator = TenantLocal("moderator", lambda t: Moderator())
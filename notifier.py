@@ -0,0 +1,204 @@
+
+# Rate-limited delivery of user notifications.
+#
+# Bulk admin actions can produce hundreds of messages at once. Callers only
+# queue them (from handlers or the dashboard thread); a background task on the
+# bot's event loop sends them with several requests in flight, paced to stay
+# under Telegram's global limit (about 30 messages/s) and its per-chat limit
+# (about one message per second). RetryAfter pauses all sending for the time
+# Telegram asks for, then the message is retried. Messages still queued at
+# shutdown are spooled to disk and sent by the next process, and so is anything
+# queued after close() or still failing (timeouts, network or server errors)
+# after MAX_ATTEMPTS tries with backoff.
+
+from collections import deque
+import threading
+import logging
+import asyncio
+import heapq
+import json
+import time
+import os
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+
+from tenants import TenantLocal
+
+GLOBAL_RATE = float(os.environ.get("NOTIFY_RATE", 25))  # messages per second
+CHAT_INTERVAL = 1.0
+MAX_IN_FLIGHT = 8
+MAX_ATTEMPTS = 5
+CLOSE_TIMEOUT = 15  # below lifecycle.DRAIN_TIMEOUT, so leftovers still get spooled
+SPOOL_FILE = "notify_spool.ndjson"
+
+
+class Notifier:
+    def __init__(self, rate=GLOBAL_RATE, chat_interval=CHAT_INTERVAL, spool_file=SPOOL_FILE):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.spool_file = spool_file
+        self.chats = {}      # chat_id -> deque of (text, kwargs) waiting to be sent
+        self.ready = []      # heap of (earliest send time, seq, chat_id), one per queued chat
+        self.last_sent = {}  # chat_id -> monotonic time of the last send
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.bot = None
+        self.loop = None
+        self.wakeup = None
+        self.task = None
+        self.inflight = set()
+        self.paused_until = 0
+        self.stopping = False
+        self.closed = False
+        self.sent = 0
+        self.failed = 0
+
+    def send(self, chat_id, text, **kwargs):
+        """Queues a message. Never blocks; safe from handlers and from the dashboard thread."""
+        with self.lock:
+            self._enqueue(chat_id, text, kwargs)
+        if self.closed:
+            self.spool()
+        elif self.loop:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def _enqueue(self, chat_id, text, kwargs):
+        # Called with self.lock held.
+        if chat_id not in self.chats:
+            self.chats[chat_id] = deque()
+            at = self.last_sent.get(chat_id, 0) + self.chat_interval
+            self.seq += 1
+            heapq.heappush(self.ready, (at, self.seq, chat_id))
+        self.chats[chat_id].append((text, kwargs))
+
+    def pending(self):
+        with self.lock:
+            return sum(len(q) for q in self.chats.values())
+
+    def start(self, bot):
+        self.bot = bot
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        for chat_id, text, kwargs in self.read_spool():
+            self.send(chat_id, text, **kwargs)
+        self.task = self.loop.create_task(self.run())
+
+    def _next(self, now):
+        """Pops the next message whose chat may receive one now, or returns the seconds to wait."""
+        with self.lock:
+            if not self.ready:
+                return None
+            at, _, chat_id = self.ready[0]
+            if at > now:
+                return at - now
+            heapq.heappop(self.ready)
+            queue = self.chats[chat_id]
+            text, kwargs = queue.popleft()
+            self.last_sent[chat_id] = now
+            if queue:
+                self.seq += 1
+                heapq.heappush(self.ready, (now + self.chat_interval, self.seq, chat_id))
+            else:
+                del self.chats[chat_id]
+            if len(self.last_sent) > 10000:
+                cutoff = now - self.chat_interval
+                self.last_sent = {c: t for c, t in self.last_sent.items() if t > cutoff}
+            return chat_id, text, kwargs
+
+    async def run(self):
+        limit = asyncio.Semaphore(MAX_IN_FLIGHT)
+        while not (self.stopping and not self.pending()):
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            item = self._next(now)
+            if not isinstance(item, tuple):
+                self.wakeup.clear()
+                if self.stopping:
+                    await asyncio.sleep(item or 0)
+                    continue
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), item)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await limit.acquire()
+            task = asyncio.create_task(self._deliver(*item))
+            self.inflight.add(task)
+            task.add_done_callback(lambda t: (self.inflight.discard(t), limit.release()))
+            await asyncio.sleep(1 / self.rate)
+
+    async def _deliver(self, chat_id, text, kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                self.sent += 1
+                return
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so every sender backs off.
+                delay = e.retry_after
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logging.warning(f"📨 Flood control: pausing notifications for {delay}s")
+                await asyncio.sleep(delay)
+            except (Forbidden, BadRequest) as e:
+                # Blocked the bot, deleted account, ...: retrying won't help.
+                logging.info(f"📨 Could not notify {chat_id}: {e}")
+                break
+            except TelegramError as e:
+                # Timeouts, network and server errors: back off and try again.
+                logging.warning(f"📨 Notifying {chat_id} failed ({e}), retrying")
+                await asyncio.sleep(2 ** attempt)
+        else:
+            # Still failing after MAX_ATTEMPTS: keep it for the next process instead of dropping it.
+            self._spool_lines([self._spool_line(chat_id, text, kwargs)])
+            return
+        self.failed += 1
+
+    @staticmethod
+    def _spool_line(chat_id, text, kwargs):
+        return json.dumps([chat_id, text, kwargs]) + "\n"
+
+    def _spool_lines(self, lines):
+        if lines:
+            with self.lock, open(self.spool_file, "a") as f:
+                f.writelines(lines)
+            logging.warning(f"📨 Spooled {len(lines)} unsent notifications.")
+
+    async def close(self, timeout=CLOSE_TIMEOUT):
+        # Sends what is already queued if it can within timeout, spools the rest.
+        self.stopping = True
+        if self.task:
+            self.wakeup.set()
+            try:
+                await asyncio.wait_for(self.task, timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.task = None
+        if self.inflight:
+            await asyncio.wait(self.inflight, timeout=3)
+        self.closed = True
+        self.spool()
+
+    def spool(self):
+        """Writes messages that were never sent to disk for the next process."""
+        with self.lock:
+            chats, self.chats, self.ready = self.chats, {}, []
+        self._spool_lines([self._spool_line(chat_id, text, kwargs)
+                           for chat_id, queue in chats.items() for text, kwargs in queue])
+
+    def read_spool(self):
+        if not os.path.exists(self.spool_file):
+            return []
+        items = []
+        with open(self.spool_file, "r") as f:
+            for line in f:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    pass
+        os.remove(self.spool_file)
+        return items
+
+
+notifier = TenantLocal("notifier", lambda t: Notifier(spool_file=t.path(SPOOL_FILE)))
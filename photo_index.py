@@ -0,0 +1,171 @@
+
+# Near-duplicate detection for submitted photos.
+#
+# Each accepted photo gets a 64-bit perceptual hash (pHash: DCT of a 32x32
+# grayscale image, low 8x8 frequencies compared against their median). Hashes
+# go into a BK-tree keyed by Hamming distance, so finding earlier submissions
+# within PHASH_THRESHOLD bits only visits a small part of the tree even with
+# tens of thousands of images. Hashing runs in the thumbnail process pool.
+# Every submission is appended to phash_index.ndjson together with the matches
+# found for it, so flags survive restarts and archived requests stay indexed.
+
+import threading
+import logging
+import math
+import json
+import time
+import os
+
+from thumbnails import thumbnailer
+from tenants import TenantLocal
+
+PHASH_FILE = "phash_index.ndjson"
+PHASH_THRESHOLD = int(os.environ.get("PHASH_THRESHOLD", 8))
+MAX_MATCHES = 5
+
+_COS = [[math.cos((2 * x + 1) * u * math.pi / 64) for x in range(32)] for u in range(8)]
+
+
+def image_phash(path):
+    # Runs in a worker process.
+    from PIL import Image
+
+    with Image.open(path) as im:
+        px = list(im.convert("L").resize((32, 32), Image.Resampling.LANCZOS).getdata())
+    rows = [px[y * 32:(y + 1) * 32] for y in range(32)]
+    # Separable 2D DCT-II, computing only the 8x8 lowest frequencies.
+    tmp = [[sum(c * p for c, p in zip(_COS[u], row)) for row in rows] for u in range(8)]
+    coeffs = [sum(c * t for c, t in zip(_COS[v], tmp[u])) for v in range(8) for u in range(8)]
+    median = sorted(coeffs[1:])[31]
+    value = 0
+    for c in coeffs:
+        value = (value << 1) | (c > median)
+    return value
+
+
+class BKTree:
+    def __init__(self):
+        self.root = None  # [hash, payloads, {distance: child}]
+        self.size = 0
+
+    def add(self, h, payload):
+        self.size += 1
+        if self.root is None:
+            self.root = [h, [payload], {}]
+            return
+        node = self.root
+        while True:
+            d = (h ^ node[0]).bit_count()
+            if d == 0:
+                node[1].append(payload)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [payload], {}]
+                return
+            node = child
+
+    def search(self, h, threshold):
+        """Yields (distance, payload) for every entry within threshold bits of h."""
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = (h ^ node[0]).bit_count()
+            if d <= threshold:
+                for payload in node[1]:
+                    yield d, payload
+            # Triangle inequality: only children at distance d±threshold can match.
+            for cd, child in node[2].items():
+                if d - threshold <= cd <= d + threshold:
+                    stack.append(child)
+
+
+class PhotoIndex:
+    def __init__(self, path=PHASH_FILE, threshold=PHASH_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.tree = BKTree()
+        self.hashes = {}    # file_unique_id -> hash
+        self.matches = {}   # file_unique_id -> matches found at its latest submission
+        self.expected = {}  # file_unique_id -> (user id, name) awaiting a hash
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def _ensure_loaded(self):
+        # Called with self.lock held.
+        if self.loaded:
+            return
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.tree.add(rec["hash"], (rec["uid"], rec["user"], rec["name"]))
+                    self.hashes[rec["uid"]] = rec["hash"]
+                    self.matches[rec["uid"]] = rec.get("matches", [])
+        self.loaded = True
+
+    def load(self):
+        with self.lock:
+            self._ensure_loaded()
+
+    def expect(self, uid, user_id, name):
+        """Registers a new submission. Photos seen before are matched right away."""
+        with self.lock:
+            self._ensure_loaded()
+            known = self.hashes.get(uid)
+            if known is None:
+                self.expected[uid] = (user_id, name)
+                return
+        self._record(uid, known, user_id, name)
+
+    def on_media(self, uid, path):
+        """Media cache listener: hashes photos that are waiting for it."""
+        with self.lock:
+            meta = self.expected.get(uid)
+        if meta is None:
+            return
+        future = thumbnailer.run(image_phash, path)
+        if future is None:
+            with self.lock:
+                self.expected.pop(uid, None)
+            return
+        future.add_done_callback(lambda f: self._hashed(uid, f))
+
+    def _hashed(self, uid, future):
+        with self.lock:
+            meta = self.expected.pop(uid, None)
+        if meta is None:
+            return
+        if future.exception():
+            logging.warning(f"🔎 Hashing {uid} failed: {future.exception()}")
+            return
+        self._record(uid, future.result(), *meta)
+
+    def _record(self, uid, h, user_id, name):
+        with self.lock:
+            found = sorted(self.tree.search(h, self.threshold), key=lambda m: m[0])
+            # The submitter's own earlier requests count too: resending an image after
+            # it was done or cancelled is exactly what admins want to see.
+            matches = [{"uid": puid, "id": puser, "name": pname, "distance": d}
+                       for d, (puid, puser, pname) in found[:MAX_MATCHES]]
+            self.tree.add(h, (uid, user_id, name))
+            self.hashes[uid] = h
+            self.matches[uid] = matches
+            line = json.dumps({"uid": uid, "hash": h, "user": user_id, "name": name,
+                               "ts": int(time.time()), "matches": matches}, separators=(",", ":"))
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+        if matches:
+            logging.warning(f"🔎 {name}'s photo looks like {len(matches)} earlier submission(s), "
+                            f"closest {matches[0]['name']} at distance {matches[0]['distance']}.")
+
+    def duplicates(self, uid):
+        with self.lock:
+            self._ensure_loaded()
+            return list(self.matches.get(uid, ()))
+
+
+photo_index = TenantLocal("photo_index", lambda t: PhotoIndex(path=t.path(PHASH_FILE)))
@@ -0,0 +1,109 @@
+
+# Streaming exports of the live queue and/or the archive for /export-queue.
+#
+# The live queue is snapshotted (references only) under the store lock when
+# streaming starts; entries are then filtered, serialized CHUNK_SIZE at a time
+# and optionally gzip-compressed on the fly, so an export never holds a full
+# serialized copy of the queue in memory.
+
+import itertools
+import codecs
+import zlib
+import json
+import csv
+import io
+
+from store import request_queue, queue_lock
+from records import parse_time
+import archive
+
+CHUNK_SIZE = 500
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_FIELDS = ["id", "name", "status", "type", "photo_id", "photo_uid", "caption", "timestamp", "done_at", "closed_at"]
+SOURCES = ("live", "archive", "all")
+
+
+def parse_bound(value, end=False):
+    """Turns YYYY-MM-DD or a full queue timestamp into epoch seconds."""
+    if not value:
+        return None
+    if len(value) == 10:
+        value += " 23:59:59" if end else " 00:00:00"
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise ValueError(f"bad date {value!r}, expected YYYY-MM-DD or YYYY-MM-DD HH:MM:SS") from None
+
+
+def iter_live():
+    # A snapshot of the references, taken when streaming starts: handlers pop
+    # and append without queue_lock, so offsets into the live list could skip
+    # or repeat records between chunks.
+    with queue_lock:
+        snapshot = list(request_queue)
+    yield from snapshot
+
+
+def iter_entries(source="live", statuses=None, since=None, until=None):
+    if source == "live":
+        entries = iter_live()
+    elif source == "archive":
+        entries = archive.iter_archive()
+    else:
+        entries = itertools.chain(archive.iter_archive(), iter_live())
+    for r in entries:
+        if statuses and r.status not in statuses:
+            continue
+        if since or until:
+            ts = r.timestamp
+            if ts is None or (since and ts < since) or (until and ts > until):
+                continue
+        yield r
+
+
+def iter_serialized(entries, fmt):
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for r in entries:
+            writer.writerow(r.to_json())
+            if buf.tell() >= 64 * 1024:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+        return
+
+    batch = []
+    for r in entries:
+        batch.append(json.dumps(r.to_json(), ensure_ascii=False))
+        if len(batch) >= CHUNK_SIZE:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_queue(fmt="ndjson", statuses=None, since=None, until=None, compress=False, source="live"):
+    """Returns a generator of bytes for the requested export."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {sorted(FORMATS)}")
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {list(SOURCES)}")
+    since, until = parse_bound(since), parse_bound(until, end=True)
+    encoder = codecs.getincrementalencoder("utf-8")()
+    chunks = (encoder.encode(text) for text in iter_serialized(iter_entries(source, statuses, since, until), fmt))
+    return gzip_stream(chunks) if compress else chunks
@@ -0,0 +1,180 @@
+
+# Streaming, validating import of queue backups for /restore-queue.
+#
+# Accepts a JSON array (the queue.json / /download-queue format) or NDJSON,
+# optionally gzip-compressed. Records are decoded one at a time from the
+# request stream, so a large backup never sits in memory as raw text plus a
+# full parse tree. Only validated records are kept.
+
+from datetime import datetime
+import codecs
+import json
+
+from store import request_queue, queue_lock, replace_queue, save_queue
+from records import Record, TIMESTAMP_FORMAT, NO_CAPTION
+
+CHUNK_SIZE = 64 * 1024
+MAX_RECORD_CHARS = 1024 * 1024  # lookahead for one record before the upload is rejected
+TRUNCATION_SLACK = 6  # longest partial token at the buffer end: "false", "\\uXXX"
+MAX_REPORTED_ERRORS = 20
+STATUSES = {"pending", "done"}
+
+
+def iter_json_records(stream, chunk_size=CHUNK_SIZE):
+    """Yields the elements of a JSON array, or the values of an NDJSON stream."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    is_array = None
+    expect = "value"  # in an array: "first" (value or ]), "value" or "separator" (, or ])
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+        return not eof
+
+    def fail(message):
+        raise ValueError(f"{message} near offset {consumed + pos}")
+
+    consumed = 0  # characters dropped from buf before pos 0, for error offsets
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            consumed += pos
+            if fill():
+                continue
+            if is_array:
+                fail("unterminated JSON array")
+            return
+        if is_array is None:
+            is_array = buf[pos] == "["
+            if is_array:
+                pos += 1
+                expect = "first"
+            continue
+        if is_array and expect != "value" and buf[pos] == "]":
+            return
+        if is_array and expect == "separator":
+            if buf[pos] != ",":
+                fail("expected ',' or ']'")
+            pos += 1
+            expect = "value"
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # A record cut off at the chunk boundary fails at (or just before)
+            # the end of the buffer, or inside a string that never closes.
+            truncated = e.pos >= len(buf) - TRUNCATION_SLACK or e.msg.startswith("Unterminated string")
+            if eof or not truncated:
+                fail(f"invalid JSON ({e.msg})")
+            if len(buf) - pos > MAX_RECORD_CHARS:
+                fail("record too large")
+            consumed += pos
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            # A number (or the whole value) may continue in the next chunk.
+            consumed += pos
+            fill()
+            continue
+        pos = end
+        expect = "separator"
+        yield obj
+
+
+def validate_record(obj):
+    """Returns a normalized queue entry, or raises ValueError describing the problem."""
+    if not isinstance(obj, dict):
+        raise ValueError("record is not an object")
+    uid = obj.get("id")
+    if not isinstance(uid, int) or isinstance(uid, bool):
+        raise ValueError("id must be an integer")
+    name = obj.get("name")
+    if not isinstance(name, str) or not name:
+        raise ValueError("name must be a non-empty string")
+    if obj.get("status") not in STATUSES:
+        raise ValueError(f"status must be one of {sorted(STATUSES)}")
+    if obj.get("type") != "photo":
+        raise ValueError("type must be 'photo'")
+    if not isinstance(obj.get("photo_id"), str) or not obj["photo_id"]:
+        raise ValueError("photo_id must be a non-empty string")
+    caption = obj.get("caption", NO_CAPTION)
+    if not isinstance(caption, str):
+        raise ValueError("caption must be a string")
+
+    record = {
+        "id": uid, "name": name,
+        "status": obj["status"], "type": "photo",
+        "photo_id": obj["photo_id"],
+        "caption": caption,
+    }
+    if obj.get("photo_uid") is not None:
+        if not isinstance(obj["photo_uid"], str):
+            raise ValueError("photo_uid must be a string")
+        record["photo_uid"] = obj["photo_uid"]
+    for field in ("timestamp", "done_at"):
+        value = obj.get(field)
+        if value is None:
+            continue
+        try:
+            datetime.strptime(value, TIMESTAMP_FORMAT)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must look like {TIMESTAMP_FORMAT}") from None
+        record[field] = value
+    return Record.from_json(record)
+
+
+def import_queue(stream, mode="replace", skip_invalid=False):
+    """Imports records from stream into the live queue.
+
+    replace swaps the whole queue for the backup; merge keeps the live queue
+    and adds backup entries for users who aren't queued yet. Duplicate user
+    ids within the backup keep their first entry. Unless skip_invalid is set,
+    any invalid record aborts the import and leaves the queue untouched.
+    """
+    if mode not in ("replace", "merge"):
+        raise ValueError("mode must be 'replace' or 'merge'")
+
+    records, seen, errors = [], set(), []
+    summary = {"mode": mode, "read": 0, "imported": 0, "duplicates": 0, "invalid": 0}
+    for index, obj in enumerate(iter_json_records(stream)):
+        summary["read"] += 1
+        try:
+            record = validate_record(obj)
+        except ValueError as e:
+            summary["invalid"] += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"record {index}: {e}")
+            continue
+        if record.id in seen:
+            summary["duplicates"] += 1
+            continue
+        seen.add(record.id)
+        records.append(record)
+
+    if errors:
+        summary["errors"] = errors
+    if summary["invalid"] and not skip_invalid:
+        summary["applied"] = False
+        return summary
+
+    if mode == "replace":
+        replace_queue(records)
+        summary["imported"] = len(records)
+    else:
+        with queue_lock:
+            live = {r.id for r in request_queue}
+            added = [r for r in records if r.id not in live]
+            summary["duplicates"] += len(records) - len(added)
+            # extend() is atomic, so entries the bot appends meanwhile are never lost.
+            request_queue.extend(added)
+            save_queue()
+        summary["imported"] = len(added)
+    summary["applied"] = True
+    summary["queue_size"] = len(request_queue)
+    return summary
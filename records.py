@@ -0,0 +1,168 @@
+
+# Queue and archive records.
+#
+# Entries used to be plain dicts, each carrying its own copies of "pending",
+# "photo", "No caption" and formatted timestamp strings. Record is a slotted
+# dataclass instead: the status is an enum, times are integer epoch seconds
+# and the repeated strings are interned, so a large archive costs a fraction
+# of the memory. to_json()/from_json() read and write the existing queue.json
+# and archive format unchanged, and record["field"] still reads and writes
+# that JSON form for code written against the dicts. view() wraps a record
+# read-only for templates without copying it.
+
+from dataclasses import dataclass, fields
+from datetime import datetime
+from enum import Enum
+import sys
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIME_FIELDS = frozenset(("timestamp", "done_at", "closed_at"))
+INTERNED_FIELDS = frozenset(("name", "type", "caption"))
+NO_CAPTION = sys.intern("No caption")
+
+_missing = object()
+
+
+class Status(str, Enum):
+    PENDING = "pending"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
+    def __str__(self):
+        return self.value
+
+    # Hash like the plain string, so "pending" and Status.PENDING are the same set/dict key.
+    __hash__ = str.__hash__
+
+
+def parse_time(value):
+    """'%Y-%m-%d %H:%M:%S' (local time) -> epoch seconds; ints pass through."""
+    if value is None or isinstance(value, int):
+        return value
+    # fromisoformat reads this format too, many times faster than strptime.
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT) if ts is not None else None
+
+
+def now():
+    return int(datetime.now().timestamp())
+
+
+@dataclass(slots=True, eq=False)
+class Record:
+    id: int
+    name: str
+    status: Status = Status.PENDING
+    type: str = None
+    photo_id: str = None
+    photo_uid: str = None
+    caption: str = None
+    timestamp: int = None
+    done_at: int = None
+    closed_at: int = None
+    update_id: int = None
+    extra: dict = None  # unknown JSON fields, kept so they survive a round trip
+
+    def __post_init__(self):
+        self.status = Status(self.status)
+        for key in INTERNED_FIELDS:
+            value = getattr(self, key)
+            if type(value) is str:
+                setattr(self, key, sys.intern(value))
+
+    @classmethod
+    def from_json(cls, data):
+        known, extra = {}, None
+        for key, value in data.items():
+            if key in _FIELDS:
+                known[key] = parse_time(value) if key in TIME_FIELDS else value
+            else:
+                extra = extra or {}
+                extra[key] = value
+        return cls(extra=extra, **known)
+
+    def to_json(self):
+        data = {}
+        for key in FIELD_NAMES:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = format_time(value) if key in TIME_FIELDS else value
+        data["status"] = self.status.value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # Mapping-style access to the JSON form, as the dicts offered.
+
+    def get(self, key, default=None):
+        if key in _FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                return default
+            return format_time(value) if key in TIME_FIELDS else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __setitem__(self, key, value):
+        if key not in _FIELDS:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        if key in TIME_FIELDS:
+            value = parse_time(value)
+        elif key == "status":
+            value = Status(value)
+        elif key in INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def view(self, **extra):
+        return RecordView(self, extra)
+
+
+FIELD_NAMES = tuple(f.name for f in fields(Record) if f.name != "extra")
+_FIELDS = frozenset(FIELD_NAMES)
+
+
+class RecordView:
+    """Read-only JSON-form view of a record, with optional extra display fields."""
+
+    __slots__ = ("_record", "_extra")
+
+    def __init__(self, record, extra=None):
+        object.__setattr__(self, "_record", record)
+        object.__setattr__(self, "_extra", extra)
+
+    def __getitem__(self, key):
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        return self._record[key]
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def get(self, key, default=None):
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        return self._record.get(key, default)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("record views are read-only")
+
+    def __setitem__(self, key, value):
+        raise TypeError("record views are read-only")
@@ -0,0 +1,273 @@
+
+# Record-and-replay of real Telegram update traffic.
+#
+# Recording is opt-in: set UPDATE_RECORD_FILE=updates.ndjson.gz and main.py
+# appends every incoming Update (user identifiers hashed) to that file.
+#
+# Replaying feeds a recording back into the real handler pipeline, against a
+# local fake Bot API, at original speed or accelerated:
+#
+#   python replay.py updates.ndjson.gz               # original timing
+#   python replay.py updates.ndjson.gz --speed 10    # 10x faster
+#   python replay.py updates.ndjson.gz --speed 0     # as fast as possible
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import threading
+import argparse
+import tempfile
+import secrets
+import hashlib
+import asyncio
+import hmac
+import gzip
+import json
+import time
+import sys
+import os
+
+# Objects whose "id" identifies a person or chat.
+USER_KEYS = {"from", "user", "chat", "sender_chat", "left_chat_member", "forward_from",
+             "forward_from_chat", "via_bot", "new_chat_members"}
+NAME_FIELDS = ("username", "first_name", "last_name", "title")
+FLUSH_EVERY = 50
+
+
+class UpdateRecorder:
+    """Appends anonymized updates to a gzip-compressed NDJSON file."""
+
+    def __init__(self, path, admin_id=None, salt=None):
+        # The salt never leaves the process, so hashed ids can't be brute-forced back.
+        self.salt = salt or secrets.token_bytes(16)
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.file = gzip.open(path, "at")
+        self._write({"meta": {
+            "started": time.time(),
+            "admin_id": self.hash_id(admin_id) if admin_id is not None else None,
+        }})
+
+    def hash_id(self, value):
+        digest = hmac.new(self.salt, str(abs(value)).encode(), hashlib.sha256).digest()
+        hashed = int.from_bytes(digest[:6], "big")
+        return -hashed if value < 0 else hashed
+
+    def hash_name(self, value):
+        return "h" + hmac.new(self.salt, value.encode(), hashlib.sha256).hexdigest()[:10]
+
+    def anonymize(self, data, key=None):
+        if isinstance(data, list):
+            return [self.anonymize(v, key) for v in data]
+        if not isinstance(data, dict):
+            return data
+        out = {k: self.anonymize(v, k) for k, v in data.items()}
+        if key in USER_KEYS:
+            if isinstance(out.get("id"), int):
+                out["id"] = self.hash_id(out["id"])
+            for field in NAME_FIELDS:
+                if isinstance(out.get(field), str):
+                    out[field] = self.hash_name(out[field])
+        if key == "callback_query":
+            out["chat_instance"] = self.hash_name(str(out.get("chat_instance", "")))
+            # Payloads such as admin_done:<user_id> carry a user id too.
+            prefix, sep, tail = str(out.get("data", "")).rpartition(":")
+            if sep and tail.lstrip("-").isdigit():
+                out["data"] = f"{prefix}:{self.hash_id(int(tail))}"
+        return out
+
+    def record(self, update):
+        self._write({"t": time.time(), "update": self.anonymize(update)})
+
+    def _write(self, obj):
+        line = json.dumps(obj, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line)
+            self.pending += 1
+            if self.pending >= FLUSH_EVERY:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_recording(path):
+    # Tolerates a truncated last gzip member from a process that was killed.
+    meta, records = {}, []
+    with gzip.open(path, "rt") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    continue
+                if "meta" in obj:
+                    meta = obj["meta"]
+                else:
+                    records.append(obj)
+        except EOFError:
+            pass
+    return meta, records
+
+
+def fake_photo():
+    # Downloads get a real (tiny) image, so thumbnails and photo hashes run too.
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xd9"
+    import io
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 120, 40)).save(out, "JPEG")
+    return out.getvalue()
+
+
+PHOTO_BYTES = fake_photo()
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    """Answers Bot API methods with plausible results and counts the calls."""
+
+    calls = {}
+    lock = threading.Lock()
+    next_message_id = 1
+
+    def do_GET(self):
+        self._handle(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", "replace")
+        try:
+            params = json.loads(body) if body.startswith("{") else parse_qs(body)
+        except ValueError:
+            params = {}
+        self._handle(params)
+
+    def _handle(self, params):
+        if self.path.startswith("/file/"):
+            return self._send(PHOTO_BYTES, "image/jpeg")
+        method = urlparse(self.path).path.rsplit("/", 1)[-1]
+        param = lambda k, d=None: (params.get(k, [d])[0] if isinstance(params.get(k), list) else params.get(k, d))
+        with FakeBotAPI.lock:
+            FakeBotAPI.calls[method] = FakeBotAPI.calls.get(method, 0) + 1
+            FakeBotAPI.next_message_id += 1
+            message_id = FakeBotAPI.next_message_id
+
+        bot = {"id": 1, "is_bot": True, "first_name": "BeruBot", "username": "replay_bot"}
+        chat_id = int(param("chat_id", 0) or 0)
+        message = {
+            "message_id": message_id, "date": int(time.time()), "from": bot,
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "text": param("text", ""),
+        }
+        results = {
+            "getMe": bot,
+            "getUpdates": [],
+            "sendMessage": message,
+            "forwardMessage": message,
+            "editMessageText": message,
+            "getChatMember": {"status": "member", "user": {
+                "id": int(param("user_id", 0) or 0), "is_bot": False, "first_name": "member"}},
+            "getFile": {"file_id": param("file_id", ""), "file_unique_id": "replay",
+                        "file_path": f"photos/{param('file_id', '')}.jpg"},
+            # Only the recorded admin may post in groups, so moderation and raids are exercised.
+            "getChatAdministrators": [{"status": "creator", "is_anonymous": False, "user": {
+                "id": int(os.environ.get("ADMIN_ID") or 0), "is_bot": False, "first_name": "admin"}}],
+            "getChat": {"id": chat_id, "type": "supergroup", "title": "replay", "permissions": {
+                "can_send_messages": True, "can_send_photos": True, "can_invite_users": True}},
+        }
+        self._send(json.dumps({"ok": True, "result": results.get(method, True)}).encode(), "application/json")
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def replay(records, app, speed):
+    from telegram import Update
+
+    from notifier import notifier
+    import lifecycle
+
+    await app.initialize()
+    await app.start()
+    notifier.start(app.bot)
+    background = asyncio.all_tasks()
+    started = time.perf_counter()
+    first = records[0]["t"] if records else 0
+    for rec in records:
+        if speed > 0:
+            delay = (rec["t"] - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await app.update_queue.put(Update.de_json(rec["update"], app.bot))
+
+    # Let queued updates finish, then shut down like the bot does: pending
+    # deletions and raid locks are flushed and notifications delivered.
+    await app.update_queue.join()
+    await lifecycle.drain()
+    pending = asyncio.all_tasks() - background
+    if pending:
+        await asyncio.wait(pending, timeout=30)
+    elapsed = time.perf_counter() - started
+    await app.stop()
+    await app.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded update stream against a fake Bot API.")
+    parser.add_argument("recording", help="gzip NDJSON file written by UPDATE_RECORD_FILE")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="time acceleration factor; 0 replays as fast as possible")
+    args = parser.parse_args()
+
+    meta, records = read_recording(args.recording)
+    if not records:
+        print("No updates in recording.")
+        return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # config reads the environment at import; point it at the fake API and a
+    # scratch directory so the live queue.json is never touched.
+    os.environ["BOT_TOKEN"] = "123456:replay"
+    os.environ["ADMIN_ID"] = str(meta.get("admin_id") or 0)
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.pop("UPDATE_RECORD_FILE", None)
+    os.environ.pop("TENANTS_FILE", None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="berureplay-"))
+    import main as bot
+
+    app = bot.build_application(os.environ["BOT_TOKEN"])
+    elapsed = asyncio.run(replay(records, app, args.speed))
+    server.shutdown()
+
+    span = records[-1]["t"] - records[0]["t"]
+    print(f"Replayed {len(records)} updates ({span:.1f}s of traffic) in {elapsed:.2f}s "
+          f"= {len(records) / elapsed:.1f} updates/s")
+    print("Bot API calls:")
+    for method, count in sorted(FakeBotAPI.calls.items(), key=lambda kv: -kv[1]):
+        print(f"  {method:<24} {count}")
+
+
+if __name__ == "__main__":
+    main()
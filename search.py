@@ -0,0 +1,208 @@
+
+# Search over the live queue and the archive for the admin dashboard.
+#
+# Each tenant has one SearchIndex covering both tiers. Captions and usernames
+# go into inverted indexes (token -> doc ids); archived entries also go into a
+# status index, and every entry into an index sorted by submit time. The index
+# is brought up to date before each query instead of being rebuilt:
+# the archive is append-only, so only the lines written since the last offset
+# are read, and the live queue is diffed by identity, so only new entries are
+# tokenized. Live entries change status in place, so their status is checked
+# on the record itself.
+#
+# Doc ids only grow, so posting lists are compact sorted arrays. Entries that
+# leave the live queue are marked dead rather than removed; a cancelled or
+# swept entry shows up again as a new archive doc. Once dead docs make up a
+# quarter of the index (and at least COMPACT_AFTER), the remaining docs are
+# renumbered and every list is rewritten without them.
+
+from bisect import bisect_left, bisect_right
+from array import array
+import threading
+import logging
+import json
+import os
+import re
+
+from store import request_queue, queue_lock
+from tenants import TenantLocal
+from records import Record, Status
+import archive
+
+TOKEN = re.compile(r"\w+")
+SOURCES = ("live", "archive", "all")
+COMPACT_AFTER = 1000
+
+
+def tokens(text):
+    return {t.lower() for t in TOKEN.findall(text or "")}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.docs = []  # doc id -> Record, None once it left the live queue
+        self.words = {}  # caption token -> array of doc ids
+        self.names = {}  # username token -> array of doc ids
+        self.by_status = {}  # archived status -> array of doc ids
+        self.dates = []  # (submit time, doc id), sorted before each query
+        self.dates_sorted = True
+        self.live = {}  # id(record) -> doc id for the current live queue
+        self.dead = 0
+        self.compactions = 0
+        self.archive_docs = array("l")
+        self.archive_path = None
+        self.archive_offset = 0
+
+    def _add(self, record, archived):
+        doc = len(self.docs)
+        self.docs.append(record)
+        for token in tokens(record.caption):
+            self.words.setdefault(token, array("l")).append(doc)
+        for token in tokens(record.name):
+            self.names.setdefault(token, array("l")).append(doc)
+        if archived:
+            self.by_status.setdefault(record.status.value, array("l")).append(doc)
+            self.archive_docs.append(doc)
+        item = (record.timestamp or 0, doc)
+        if self.dates and item < self.dates[-1]:
+            self.dates_sorted = False
+        self.dates.append(item)
+        return doc
+
+    def _refresh_archive(self):
+        path = archive.archive_file()
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if path != self.archive_path or size < self.archive_offset:
+            # First use, or the archive was replaced: start over.
+            self._reset()
+            self.archive_path = path
+        if size == self.archive_offset:
+            return
+        added = 0
+        with archive.archive_lock, open(path, "rb") as f:
+            f.seek(self.archive_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                self.archive_offset += len(line)
+                try:
+                    self._add(Record.from_json(json.loads(line)), archived=True)
+                    added += 1
+                except (ValueError, TypeError):
+                    continue
+        if added > 100:
+            logging.info(f"🔍 Indexed {added} archived requests.")
+
+    def _refresh_live(self):
+        with queue_lock:
+            queue = list(request_queue)
+        live = {}
+        for r in queue:
+            doc = self.live.get(id(r))
+            if doc is None or self.docs[doc] is not r:
+                doc = self._add(r, archived=False)
+            live[id(r)] = doc
+        for key, doc in self.live.items():
+            if key not in live:
+                self.docs[doc] = None
+                self.dead += 1
+        self.live = live
+        if self.dead >= COMPACT_AFTER and self.dead * 4 >= len(self.docs):
+            self._compact()
+        return queue
+
+    def _compact(self):
+        # Doc ids keep their order, so posting lists and dates stay sorted.
+        remap = array("l", [-1]) * len(self.docs)
+        docs = []
+        for doc, record in enumerate(self.docs):
+            if record is not None:
+                remap[doc] = len(docs)
+                docs.append(record)
+
+        def rewrite(index):
+            for key, postings in list(index.items()):
+                kept = array("l", (remap[d] for d in postings if remap[d] >= 0))
+                if kept:
+                    index[key] = kept
+                else:
+                    del index[key]
+
+        rewrite(self.words)
+        rewrite(self.names)
+        rewrite(self.by_status)
+        self.dates = [(ts, remap[d]) for ts, d in self.dates if remap[d] >= 0]
+        self.archive_docs = array("l", (remap[d] for d in self.archive_docs))
+        self.live = {key: remap[doc] for key, doc in self.live.items()}
+        logging.info(f"🔍 Compacted the search index: dropped {len(self.docs) - len(docs)} stale entries.")
+        self.docs = docs
+        self.dead = 0
+        self.compactions += 1
+
+    def warm(self):
+        """Indexes the archive ahead of the first query."""
+        with self.lock:
+            self._refresh_archive()
+            self._refresh_live()
+
+    def search(self, q=None, user=None, statuses=None, since=None, until=None, source="live"):
+        """Matching records: live ones in queue order, then archived ones newest first.
+
+        q matches words in captions or usernames (all words must match), user
+        matches usernames, statuses is a set of status names and since/until
+        are epoch bounds on the submit time.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {list(SOURCES)}")
+        with self.lock:
+            self._refresh_archive()
+            queue = self._refresh_live()
+
+            matches = None
+
+            def narrow(docs):
+                nonlocal matches
+                matches = set(docs) if matches is None else matches.intersection(docs)
+
+            for token in tokens(q):
+                narrow(set(self.words.get(token, ())) | set(self.names.get(token, ())))
+            for token in tokens(user):
+                narrow(self.names.get(token, ()))
+            if since is not None or until is not None:
+                if not self.dates_sorted:
+                    self.dates.sort()
+                    self.dates_sorted = True
+                lo = bisect_left(self.dates, (since if since is not None else float("-inf"),))
+                hi = bisect_right(self.dates, (until if until is not None else float("inf"), float("inf")))
+                narrow(doc for _, doc in self.dates[lo:hi])
+
+            results = []
+            if source != "archive":
+                results += [r for r in queue
+                            if (matches is None or self.live[id(r)] in matches)
+                            and (not statuses or r.status in statuses)]
+            if source != "live":
+                archived = self.archive_docs
+                if statuses:
+                    wanted = set()
+                    for status in statuses:
+                        wanted.update(self.by_status.get(Status(status).value, ()))
+                    archived = [doc for doc in archived if doc in wanted]
+                if matches is not None:
+                    archived = [doc for doc in archived if doc in matches]
+                results += [self.docs[doc] for doc in reversed(archived)]
+            return results
+
+    def metrics(self):
+        return {"docs": len(self.docs), "live": len(self.live), "archived": len(self.archive_docs),
+                "dead": self.dead, "compactions": self.compactions, "tokens": len(self.words) + len(self.names)}
+
+
+search_index = TenantLocal("search", lambda t: SearchIndex())
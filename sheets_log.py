@@ -0,0 +1,152 @@
+
+# Google Sheets request log.
+#
+# Handlers only append a row to an in-memory buffer. A background task on the
+# bot's event loop sends buffered rows with one append_rows call per batch,
+# either when the batch is full or every FLUSH_INTERVAL seconds. gspread is
+# synchronous, so the calls themselves run in a worker thread. While Sheets is
+# unavailable (quota exhausted, network down) rows are spooled to disk and
+# sent first once it recovers, so nothing is lost across restarts either.
+
+from datetime import datetime
+import threading
+import logging
+import asyncio
+import json
+import time
+import os
+
+from config import credentials_file
+
+SPREADSHEET_NAME = os.environ.get("SHEETS_SPREADSHEET", "Request_Sheet")
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive"
+]
+SPOOL_FILE = "sheets_spool.ndjson"
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 10
+MAX_ROWS_PER_CALL = 500
+MIN_BACKOFF = 30
+MAX_BACKOFF = 600
+
+
+def open_worksheet():
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_file(), SCOPE)
+    return gspread.authorize(creds).open(SPREADSHEET_NAME).sheet1
+
+
+def is_quota_error(e):
+    response = getattr(e, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+class SheetsLog:
+    def __init__(self, open_worksheet=open_worksheet, batch_size=BATCH_SIZE,
+                 interval=FLUSH_INTERVAL, spool_file=SPOOL_FILE):
+        self.open_worksheet = open_worksheet
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spool_file = spool_file
+        self.rows = []
+        self.lock = threading.Lock()
+        self.worksheet = None
+        self.loop = None
+        self.wakeup = None
+        self.task = None
+        self.stopping = False
+        self.backoff = 0
+        self.retry_at = 0
+
+    def log(self, request):
+        """Never blocks: safe to call from handlers and from the dashboard thread."""
+        row = [
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"), request["name"],
+            request["type"], request.get("caption", request.get("content", "")), request["status"]
+        ]
+        with self.lock:
+            self.rows.append(row)
+            full = len(self.rows) >= self.batch_size
+        if full and self.loop:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.task = self.loop.create_task(self.run())
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        # Lets an in-progress flush finish rather than cancelling it halfway.
+        self.stopping = True
+        if self.task:
+            self.wakeup.set()
+            await self.task
+            self.task = None
+        await self.flush()
+
+    async def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if time.monotonic() < self.retry_at:
+            self.spool(rows)
+            return
+
+        batch = self.read_spool() + rows
+        sent = 0
+        try:
+            if batch and self.worksheet is None:
+                self.worksheet = await asyncio.to_thread(self.open_worksheet)
+            while sent < len(batch):
+                chunk = batch[sent:sent + MAX_ROWS_PER_CALL]
+                await asyncio.to_thread(self.worksheet.append_rows, chunk, value_input_option="RAW")
+                sent += len(chunk)
+        except Exception as e:
+            self.backoff = min(max(self.backoff * 2, MIN_BACKOFF), MAX_BACKOFF)
+            self.retry_at = time.monotonic() + self.backoff
+            reason = "quota exhausted" if is_quota_error(e) else e
+            logging.warning(f"📄 Sheets unavailable ({reason}); spooling "
+                            f"{len(batch) - sent} rows, retry in {self.backoff}s")
+            self.write_spool(batch[sent:])
+            return
+
+        self.backoff = 0
+        if os.path.exists(self.spool_file):
+            os.remove(self.spool_file)
+        if sent:
+            logging.info(f"📄 Logged {sent} rows to Sheets.")
+
+    def read_spool(self):
+        if not os.path.exists(self.spool_file):
+            return []
+        rows = []
+        with open(self.spool_file, "r") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass
+        return rows
+
+    def spool(self, rows):
+        if not rows:
+            return
+        with open(self.spool_file, "a") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+
+    def write_spool(self, rows):
+        tmp = self.spool_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        os.replace(tmp, self.spool_file)
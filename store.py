@@ -0,0 +1,101 @@
+
+# Request queue shared by the bot handlers and the dashboard.
+# request_queue is only ever mutated in place, so `from store import request_queue`
+# stays valid across loads and resets. Writers outside the bot's event loop
+# (the dashboard thread) take queue_lock. Each tenant has its own queue and
+# queue file; request_queue resolves to the current tenant's list. Entries are
+# records.Record objects, stored in the usual JSON form. A dashboard running in
+# its own process (web.py) keeps its copy current with refresh_queue().
+
+import threading
+import logging
+import json
+import os
+
+from config import QUEUE_FILE
+from tenants import TenantList, current
+from records import Record, Status
+
+request_queue = TenantList("queue")
+queue_lock = threading.RLock()
+loaded_versions = {}  # queue file -> (mtime_ns, size) last read by refresh_queue
+
+
+def queue_file():
+    return current().path(QUEUE_FILE)
+
+
+def load_queue():
+    if os.path.exists(queue_file()):
+        try:
+            with open(queue_file(), "r") as f:
+                request_queue[:] = [Record.from_json(r) for r in json.load(f)]
+                logging.info("✅ Queue loaded successfully from disk.")
+        except Exception as e:
+            logging.error(f"❌ Failed to load queue: {e}")
+
+
+def refresh_queue():
+    """Re-reads the queue file if another process replaced it. Returns True if it did.
+
+    Entries whose JSON is unchanged keep their Record object, so identity-based
+    caches (search.py) only see what actually changed.
+    """
+    path = queue_file()
+    with queue_lock:
+        try:
+            st = os.stat(path)
+            version = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            version = None
+        if loaded_versions.get(path, False) == version:
+            return False
+        loaded_versions[path] = version
+        if version is None:
+            request_queue.clear()
+            return True
+        try:
+            with open(path, "r") as f:
+                fresh = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"❌ Failed to reload queue: {e}")
+            return False
+        known = {(r.id, r.timestamp, r.photo_uid): r for r in request_queue}
+        merged = []
+        for entry in fresh:
+            record = Record.from_json(entry)
+            old = known.get((record.id, record.timestamp, record.photo_uid))
+            merged.append(old if old is not None and old.to_json() == entry else record)
+        request_queue[:] = merged
+        return True
+
+
+def save_queue():
+    try:
+        # Written to a temp file first so a crash mid-write never leaves a torn queue.
+        path = queue_file()
+        tmp = path + ".tmp"
+        with queue_lock, open(tmp, "w") as f:
+            json.dump([r.to_json() for r in request_queue.local()], f)
+        os.replace(tmp, path)
+        logging.info(f"💾 Queue saved ({len(request_queue)} items).")
+    except Exception as e:
+        logging.error(f"❌ Failed to save queue: {e}")
+
+
+def active_count():
+    return sum(1 for r in request_queue if r.status is Status.PENDING)
+
+
+def replace_queue(records):
+    # A single slice assignment, so readers see either the old or the new queue.
+    with queue_lock:
+        request_queue[:] = records
+        save_queue()
+
+
+def reset_queue():
+    with queue_lock:
+        request_queue.clear()
+        if os.path.exists(queue_file()):
+            os.remove(queue_file())
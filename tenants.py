@@ -0,0 +1,161 @@
+
+# Several bots (tenants) in one process.
+#
+# Without TENANTS_FILE there is a single default tenant built from BOT_TOKEN,
+# ADMIN_ID and QUEUE_PASSWORD, with its files in the working directory as
+# before. With it, each entry of the JSON file is a tenant with its own token,
+# admins, dashboard password and data directory:
+#
+#   {"tenants": [{"name": "beru", "bot_token_env": "BERU_TOKEN", "admin_ids": [1],
+#                 "queue_password": "...", "max_requests": 50, "data_dir": "."}]}
+#
+# Per-tenant state (the queue, capacity, archive, ...) is reached through
+# TenantLocal proxies that resolve against the tenant active in the current
+# context. Each bot's Application is started inside its tenant's context, so
+# every handler, job and task it spawns inherits it; dashboard requests under
+# /t/<name>/ are switched by the WSGI middleware in dashboard.py.
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import asyncio
+import json
+import os
+
+from config import BOT_TOKEN, ADMIN_ID, QUEUE_PASSWORD, MAX_REQUESTS
+
+TENANTS_FILE = os.environ.get("TENANTS_FILE")
+TENANTS_DIR = "tenants"
+
+_current = ContextVar("tenant", default=None)
+_lock = threading.Lock()
+
+
+class Tenant:
+    def __init__(self, name, bot_token, admin_ids, password=None, data_dir=".", max_requests=MAX_REQUESTS):
+        if not bot_token:
+            raise ValueError(f"tenant {name!r} has no bot token")
+        self.name = name
+        self.bot_token = bot_token
+        self.admin_ids = frozenset(admin_ids)
+        self.password = password
+        self.data_dir = data_dir
+        self.max_requests = max_requests
+        self.components = {}
+        os.makedirs(data_dir, exist_ok=True)
+
+    def path(self, filename):
+        return filename if self.data_dir == "." else os.path.join(self.data_dir, filename)
+
+    @contextmanager
+    def active(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def __repr__(self):
+        return f"<Tenant {self.name}>"
+
+
+def _from_entry(entry):
+    name = entry["name"]
+    token = entry.get("bot_token") or os.environ.get(entry.get("bot_token_env", ""))
+    return Tenant(
+        name, token, entry.get("admin_ids", []),
+        password=entry.get("queue_password") or os.environ.get(entry.get("queue_password_env", "")),
+        data_dir=entry.get("data_dir", os.path.join(TENANTS_DIR, name)),
+        max_requests=int(entry.get("max_requests", MAX_REQUESTS)),
+    )
+
+
+def load_tenants():
+    if not TENANTS_FILE:
+        return [Tenant("default", BOT_TOKEN, [ADMIN_ID] if ADMIN_ID is not None else [], QUEUE_PASSWORD)]
+    with open(TENANTS_FILE, "r") as f:
+        entries = json.load(f)["tenants"]
+    loaded = [_from_entry(e) for e in entries]
+    names = [t.name for t in loaded]
+    if not loaded or len(set(names)) != len(names):
+        raise ValueError(f"{TENANTS_FILE} needs at least one tenant and unique names")
+    return loaded
+
+
+tenants = load_tenants()
+by_name = {t.name: t for t in tenants}
+multi = TENANTS_FILE is not None
+
+
+def current():
+    """The tenant of the running handler or request; the first tenant outside of one."""
+    return _current.get() or tenants[0]
+
+
+def activate(tenant):
+    """Makes tenant current for the rest of the running context (use in a fresh one)."""
+    _current.set(tenant)
+
+
+async def each(fn):
+    """Calls fn() (plain or async) once in every tenant's context."""
+    for tenant in tenants:
+        with tenant.active():
+            result = fn()
+            if asyncio.iscoroutine(result):
+                await result
+
+
+class TenantLocal:
+    """Proxy to a per-tenant object, made by factory(tenant) on first use in that tenant."""
+
+    def __init__(self, key, factory):
+        object.__setattr__(self, "_key", key)
+        object.__setattr__(self, "_factory", factory)
+
+    def local(self, tenant=None):
+        tenant = tenant or current()
+        obj = tenant.components.get(self._key)
+        if obj is None:
+            with _lock:
+                obj = tenant.components.get(self._key)
+                if obj is None:
+                    obj = tenant.components[self._key] = self._factory(tenant)
+        return obj
+
+    def __getattr__(self, name):
+        return getattr(self.local(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.local(), name, value)
+
+
+class TenantList(TenantLocal):
+    """A per-tenant list that behaves like the list itself for the usual operations."""
+
+    def __init__(self, key):
+        super().__init__(key, lambda tenant: [])
+
+    def __len__(self):
+        return len(self.local())
+
+    def __iter__(self):
+        return iter(self.local())
+
+    def __bool__(self):
+        return bool(self.local())
+
+    def __contains__(self, item):
+        return item in self.local()
+
+    def __getitem__(self, index):
+        return self.local()[index]
+
+    def __setitem__(self, index, value):
+        self.local()[index] = value
+
+    def __delitem__(self, index):
+        del self.local()[index]
+
+    def __repr__(self):
+        return repr(self.local())
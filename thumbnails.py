@@ -0,0 +1,142 @@
+
+# Dashboard thumbnails.
+#
+# Every photo that lands in the media cache gets a small JPEG thumbnail. The
+# decoding and resizing run in a process pool, so neither the bot's event loop
+# nor the dashboard threads spend CPU (or hold the GIL) on image work. Workers
+# come from a forkserver, so they start clean instead of forking the threaded
+# bot process. The bot starts the pool in post_init (never on its event loop)
+# and shuts it down while draining; the web process starts it on first use.
+# Pillow is optional: without it the dashboard keeps plain links.
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import importlib.util
+import threading
+import logging
+import asyncio
+import os
+
+THUMB_DIR = os.environ.get("THUMBNAIL_DIR", "thumbs")
+THUMB_SIZE = int(os.environ.get("THUMBNAIL_SIZE", 320))
+THUMB_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", 1))
+THUMB_QUALITY = 70
+THUMB_WAIT = 5
+
+
+def make_thumbnail(src, dst, size=THUMB_SIZE):
+    # Runs in a worker process.
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((size, size))
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        tmp = f"{dst}.{os.getpid()}.part"
+        im.save(tmp, "JPEG", quality=THUMB_QUALITY, optimize=True)
+    os.replace(tmp, dst)
+    return dst
+
+
+class Thumbnailer:
+    def __init__(self, directory=THUMB_DIR, workers=THUMB_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self.enabled = importlib.util.find_spec("PIL") is not None
+        self.pool = None
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def path(self, uid):
+        return os.path.join(self.directory, f"{uid}.jpg")
+
+    def get(self, uid):
+        path = self.path(uid)
+        return path if os.path.exists(path) else None
+
+    def start(self):
+        """Starts the worker pool. Blocks while the forkserver comes up, so run it off the event loop."""
+        with self.lock:
+            if self.enabled and self.pool is None:
+                self._start_pool()
+            pool = self.pool
+        if pool:
+            # Workers spawn on first submit; that is when the forkserver comes up.
+            try:
+                pool.submit(os.getpid).result()
+            except Exception as e:
+                logging.warning(f"🖼️ Thumbnail workers failed to start: {e}")
+
+    def _start_pool(self):
+        # Called with self.lock held.
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if ctx.get_start_method() == "forkserver":
+            ctx.set_forkserver_preload(["thumbnails", "photo_index"])
+        os.makedirs(self.directory, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+
+    def _pool(self):
+        # Called with self.lock held. Threads (the dashboard) may start the pool on
+        # first use; the event loop never does: the bot starts it in post_init.
+        if self.pool is None:
+            try:
+                asyncio.get_running_loop()
+                return None
+            except RuntimeError:
+                self._start_pool()
+        return self.pool
+
+    def submit(self, uid, src):
+        """Queues a thumbnail for uid; safe from any thread. Returns a future, or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            if uid in self.pending:
+                return self.pending[uid]
+            if os.path.exists(self.path(uid)):
+                return None
+            pool = self._pool()
+            if pool is None:
+                return None
+            future = pool.submit(make_thumbnail, src, self.path(uid))
+            self.pending[uid] = future
+        future.add_done_callback(lambda f: self._done(uid, f))
+        return future
+
+    def run(self, fn, *args):
+        """Runs another image job (e.g. hashing) on the same worker pool. Returns a future, or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            pool = self._pool()
+            return pool.submit(fn, *args) if pool else None
+
+    def _done(self, uid, future):
+        with self.lock:
+            self.pending.pop(uid, None)
+        if future.exception():
+            logging.warning(f"🖼️ Thumbnail for {uid} failed: {future.exception()}")
+
+    def ensure(self, uid, src, timeout=THUMB_WAIT):
+        """Returns the thumbnail path, waiting briefly for a worker to make it if needed."""
+        path = self.get(uid)
+        if path or not self.enabled:
+            return path
+        future = self.submit(uid, src)
+        try:
+            if future:
+                future.result(timeout)
+        except Exception:
+            return None
+        return self.get(uid)
+
+    async def drain(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            await asyncio.to_thread(pool.shutdown, True)
+
+
+thumbnailer = Thumbnailer()
@@ -0,0 +1,248 @@
+
+# Production serving for the dashboard, in processes of its own.
+#
+#   DASHBOARD_MODE=external python main.py    # the bot
+#   DASHBOARD_MODE=external python web.py     # the dashboard, on PORT
+#
+# web.py serves the same Flask app under gunicorn (WEB_WORKERS processes with
+# WEB_THREADS threads each) when it is installed, otherwise under waitress or
+# Werkzeug's threaded server (both single-process). Public traffic is handled
+# outside the bot process, so it never competes with update handling for the
+# bot's GIL.
+#
+# Both processes share the data files. Before each request the tenant's queue
+# is re-read if the bot replaced queue.json (store.refresh_queue), capacity if
+# its state file changed, duplicate flags if the hash file changed and archive
+# statistics (/history) if the archive grew; the search index follows the
+# archive on its own. ETA rates are rebuilt in the background every
+# WEB_RELOAD_INTERVAL seconds. Admin actions that change the queue or message
+# users, and /metrics (the bot's own counters), are forwarded to the bot's
+# control endpoint on 127.0.0.1:CONTROL_PORT.
+
+import contextvars
+import threading
+import logging
+import time
+import os
+
+from log_setup import setup_logging, stop_logging
+
+setup_logging()
+
+from werkzeug.wsgi import get_input_stream
+
+from config import PORT, CONTROL_PORT, DASHBOARD_MODE
+from tenants import tenants, current, activate
+from store import refresh_queue
+from capacity import capacity
+from photo_index import photo_index
+from eta import estimator, EtaEstimator
+from search import search_index
+import archive
+from http_client import http, HTTP_CONNECT_TIMEOUT
+from dashboard import flask_app
+
+WEB_SERVER = os.environ.get("WEB_SERVER", "auto")  # gunicorn, waitress or werkzeug
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 2))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+WEB_KEEPALIVE = int(os.environ.get("WEB_KEEPALIVE", 5))  # seconds an idle connection stays open
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", 60))
+WEB_RELOAD_INTERVAL = float(os.environ.get("WEB_RELOAD_INTERVAL", 300))
+CONTROL_URL = f"http://127.0.0.1:{CONTROL_PORT}"
+
+# Routes that need the bot process: they change the queue, notify users or report its counters.
+FORWARDED = {"/reset", "/bulk", "/restore-queue", "/metrics"}
+HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+               "te", "trailer", "trailers", "transfer-encoding", "upgrade", "host"}
+
+seen_versions = {}  # shared file -> (mtime_ns, size) last loaded
+eta_built_at = {}  # tenant name -> monotonic time of the last rebuild
+eta_lock = threading.Lock()
+
+
+def file_version(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def changed(path):
+    version = file_version(path)
+    if seen_versions.get(path, False) == version:
+        return False
+    seen_versions[path] = version
+    return True
+
+
+def rebuild_eta(tenant):
+    fresh = EtaEstimator()
+    fresh.load()
+    tenant.components[estimator._key] = fresh
+
+
+def sync_shared_state():
+    """Picks up what the bot wrote since the last request of this tenant."""
+    tenant = current()
+    refresh_queue()
+    if changed(capacity.state_file):
+        capacity.load()
+    if changed(photo_index.path):
+        tenant.components.pop(photo_index._key, None)  # reloaded on next use
+    if changed(archive.archive_file()):
+        tenant.components.pop("archive_stats", None)
+    now = time.monotonic()
+    with eta_lock:
+        due = now - eta_built_at.get(tenant.name, float("-inf")) >= WEB_RELOAD_INTERVAL
+        if due:
+            eta_built_at[tenant.name] = now
+    if due:
+        # The archive can be large; requests keep using the old rates until this is done.
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(rebuild_eta, tenant), name="eta-reload", daemon=True).start()
+
+
+class Body:
+    """The request body with a known length, so it is streamed to the bot as is."""
+
+    def __init__(self, environ):
+        self.stream = get_input_stream(environ)
+        self.length = int(environ.get("CONTENT_LENGTH") or 0)
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+class ForwardedResponse:
+    def __init__(self, res):
+        self.res = res
+
+    def __iter__(self):
+        # Raw bytes, so a gzip body keeps matching its Content-Length.
+        return self.res.raw.stream(64 * 1024, decode_content=False)
+
+    def close(self):
+        self.res.close()
+
+
+class BotForwarder:
+    """Sends the FORWARDED routes (with or without a /t/<name> prefix) to the bot."""
+
+    def __init__(self, app, target=CONTROL_URL):
+        self.app = app
+        self.target = target
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        route = "/" + path[3:].partition("/")[2] if path.startswith("/t/") else path
+        if route not in FORWARDED:
+            return self.app(environ, start_response)
+
+        headers = {key[5:].replace("_", "-").title(): value for key, value in environ.items()
+                   if key.startswith("HTTP_") and key[5:].replace("_", "-").lower() not in HOP_HEADERS}
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        forwarded_for = headers.get("X-Forwarded-For")
+        remote = environ.get("REMOTE_ADDR", "")
+        headers["X-Forwarded-For"] = f"{forwarded_for}, {remote}" if forwarded_for else remote
+        query = environ.get("QUERY_STRING")
+        url = self.target + environ.get("SCRIPT_NAME", "") + path + (f"?{query}" if query else "")
+        body = Body(environ)
+        try:
+            res = http.request(environ["REQUEST_METHOD"], url, retry=False, headers=headers,
+                               data=body if len(body) else None, stream=True, allow_redirects=False,
+                               timeout=(HTTP_CONNECT_TIMEOUT, WEB_TIMEOUT))
+        except Exception as e:
+            logging.error(f"❌ Could not reach the bot at {self.target}: {e}")
+            start_response("502 BAD GATEWAY", [("Content-Type", "text/plain")])
+            return [b"The bot is not reachable right now. Try again in a moment."]
+        start_response(f"{res.status_code} {res.reason}",
+                       [(k, v) for k, v in res.headers.items() if k.lower() not in HOP_HEADERS])
+        return ForwardedResponse(res)
+
+
+def warm():
+    """Loads every tenant's queue and indexes ahead of the first request."""
+    for tenant in tenants:
+        def load():
+            sync_shared_state()
+            search_index.warm()
+
+        ctx = contextvars.Context()
+        ctx.run(activate, tenant)
+        threading.Thread(target=ctx.run, args=(load,), name=f"warm-{tenant.name}", daemon=True).start()
+
+
+flask_app.before_request(sync_shared_state)
+app = BotForwarder(flask_app)  # the WSGI entry point, e.g. for `gunicorn web:app`
+
+
+def serve_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"0.0.0.0:{PORT}", "workers": WEB_WORKERS, "threads": WEB_THREADS,
+                "worker_class": "gthread", "keepalive": WEB_KEEPALIVE, "timeout": WEB_TIMEOUT,
+                # Each worker forks without any loaded state and warms up on its own.
+                "post_worker_init": lambda worker: warm(),
+                # The master keeps logging (startup, worker restarts); each process flushes its own log writer.
+                "worker_exit": lambda server, worker: stop_logging(),
+                "on_exit": lambda server: stop_logging(),
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    # Workers start their own log writer after the fork (see log_setup.py).
+    Server().run()
+
+
+def serve_waitress():
+    from waitress import serve
+
+    if WEB_WORKERS > 1:
+        logging.info("🌐 waitress runs a single process; WEB_WORKERS is ignored.")
+    warm()
+    serve(app, host="0.0.0.0", port=PORT, threads=WEB_THREADS, channel_timeout=WEB_KEEPALIVE)
+
+
+def serve_werkzeug():
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    logging.warning("🌐 Neither gunicorn nor waitress is installed; serving with Werkzeug.")
+    if WEB_WORKERS > 1:
+        # Its processes mode forks per request and throws the loaded state away each time.
+        logging.info("🌐 Werkzeug runs a single process; WEB_WORKERS is ignored.")
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"  # keep-alive
+    warm()
+    make_server("0.0.0.0", PORT, app, threaded=True).serve_forever()
+
+
+SERVERS = {"gunicorn": serve_gunicorn, "waitress": serve_waitress, "werkzeug": serve_werkzeug}
+
+
+def pick_server():
+    if WEB_SERVER != "auto":
+        if WEB_SERVER not in SERVERS:
+            raise ValueError(f"WEB_SERVER must be auto or one of {sorted(SERVERS)}")
+        return WEB_SERVER
+    import importlib.util
+
+    return next((name for name in ("gunicorn", "waitress") if importlib.util.find_spec(name)), "werkzeug")
+
+
+if __name__ == "__main__":
+    if DASHBOARD_MODE != "external":
+        logging.warning("🌐 DASHBOARD_MODE is not 'external': the bot is serving the dashboard on the same port too.")
+    name = pick_server()
+    logging.info(f"🌐 Dashboard on :{PORT} with {name} ({WEB_WORKERS} workers x {WEB_THREADS} threads), "
+                 f"admin actions go to {CONTROL_URL}.")
+    SERVERS[name]()